@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database.connection import engine
 from database.models import Base
+from database.migrations import run_migrations
 from fastapi.exceptions import RequestValidationError
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
@@ -11,6 +12,9 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Import des routes
 from api.routes import ingest, chat, search, auth
+from repositories.log import log_writer
+from repositories.prompt import prompt_repository
+from services.llm import llm_service
 
 # Configuration Logs
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +22,7 @@ logger = logging.getLogger("api")
 
 # Initialisation DB (Au démarrage)
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(
     title="RAGTime Local API",
@@ -60,6 +65,28 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
+# Writer de logs en tâche de fond : démarré avec l'app, vidé à l'arrêt
+@app.on_event("startup")
+def start_log_writer():
+    log_writer.start()
+
+@app.on_event("startup")
+def preload_prompts():
+    try:
+        prompt_repository.preload()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"⚠️ Préchargement des prompts impossible : {e}")
+
+@app.on_event("startup")
+def resolve_llm_context_window():
+    # Interroge Ollama une fois au démarrage plutôt que pendant la première requête
+    llm_service.warm_up()
+
+@app.on_event("shutdown")
+def stop_log_writer():
+    log_writer.stop()
+
+
 # Configuration CORS (Pour autoriser le frontend)
 app.add_middleware(
     CORSMiddleware,
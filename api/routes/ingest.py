@@ -1,8 +1,11 @@
 import shutil
 import os
+import asyncio
 import uuid
+import json
 import logging
 from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from services.files import files_service
 
@@ -52,15 +55,15 @@ async def ingest_url_delete_legacy(url: str = Query(...), employee: str = Query(
 
 @router.post("/urls", response_model=IngestResponse)
 async def ingest_url_post_legacy(request: IngestUrlRequest, fields: Optional[str] = Query(None)):
-    return ingestion_service.process_input(input_data=request.url, employee=request.employee, tags=request.tags, origin=f"legacy_post_{fields}" if fields else "legacy_post")
+    return await asyncio.to_thread(ingestion_service.process_input, input_data=request.url, employee=request.employee, tags=request.tags, origin=f"legacy_post_{fields}" if fields else "legacy_post")
 
 @router.post("/text", response_model=IngestResponse)
 async def ingest_text(request: IngestTextRequest):
-    return ingestion_service.process_input(input_data=request.text, employee=request.employee, tags=request.tags, origin="api_text")
+    return await asyncio.to_thread(ingestion_service.process_input, input_data=request.text, employee=request.employee, tags=request.tags, origin="api_text")
 
 @router.post("/url", response_model=IngestResponse)
 async def ingest_url(request: IngestUrlRequest):
-    return ingestion_service.process_input(input_data=request.url, employee=request.employee, tags=request.tags, origin="api_url")
+    return await asyncio.to_thread(ingestion_service.process_input, input_data=request.url, employee=request.employee, tags=request.tags, origin="api_url")
 
 @router.get("/version")
 async def get_version(): return {"version": "locale"}
@@ -83,10 +86,10 @@ async def user_chat_legacy(request: ChatRequestNode):
     """
     try:
         # Traitement
-        chat_result = chat_service.handle_node_chat(request)
+        chat_result = await chat_service.ahandle_node_chat(request)
         
         # Info Crédits
-        credit_info = credits_repository.get_current_credit(request.employee)
+        credit_info = await asyncio.to_thread(credits_repository.get_current_credit, request.employee)
         final_job_id = request.job_id if request.job_id else f"job_{uuid.uuid4()}"
 
         return {
@@ -104,6 +107,40 @@ async def user_chat_legacy(request: ChatRequestNode):
             "response": f"Error: {str(e)}",
             "sources": []
         }
+
+@router.post("/userchat/stream")
+async def user_chat_stream(request: ChatRequestNode):
+    """
+    Variante streaming de /userchat (NDJSON, une trame JSON par ligne) :
+    sources d'abord, puis les tokens, puis une trame finale au format de /userchat.
+    """
+    final_job_id = request.job_id if request.job_id else f"job_{uuid.uuid4()}"
+
+    async def frames():
+        sources = []
+        try:
+            async for event in chat_service.astream_node_chat(request):
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                    yield json.dumps({"type": "sources", "sources": sources, "job_id": final_job_id}) + "\n"
+                elif event["type"] == "token":
+                    yield json.dumps({"type": "token", "content": event["content"]}) + "\n"
+                else:
+                    credit_info = await asyncio.to_thread(credits_repository.get_current_credit, request.employee)
+                    yield json.dumps({
+                        "type": "final",
+                        "status": "success",
+                        "response": event["response"],
+                        "sources": sources,
+                        "currentUsage": credit_info["currentUsage"],
+                        "totalCredit": credit_info["totalCredit"],
+                        "job_id": final_job_id
+                    }) + "\n"
+        except Exception as e:
+            logger.error(f"❌ Erreur POST /ingest/userchat/stream: {e}", exc_info=True)
+            yield json.dumps({"type": "final", "status": "error", "response": f"Error: {str(e)}", "sources": [], "job_id": final_job_id}) + "\n"
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
     
 @router.post("/file", response_model=IngestResponse)
 async def ingest_file(
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import chromadb # <-- Import nécessaire
 import os
@@ -10,7 +10,39 @@ load_dotenv()
 SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "local_database.db")
 DATABASE_URL = f"sqlite:///{SQLITE_DB_PATH}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Profil de performance appliqué à chaque nouvelle connexion :
+# - WAL : les lectures (chat) ne sont plus bloquées par l'écrivain (ingestion en tâche de fond)
+# - busy_timeout : un écrivain concurrent attend au lieu de lever "database is locked"
+# SQLITE_PROFILE=default pour revenir au comportement SQLite d'origine.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance").lower()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",                                        # sûr en WAL, beaucoup moins de fsync
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024))),  # négatif = en KiB
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "temp_store": "MEMORY",
+}
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    pool_size=int(os.getenv("SQLITE_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("SQLITE_MAX_OVERFLOW", "20")),
+    pool_timeout=30,
+    pool_pre_ping=True,
+)
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if SQLITE_PROFILE != "performance":
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -25,4 +57,22 @@ CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "local_chroma_db")
 
 def get_chroma_client():
     """Retourne une instance unique du client ChromaDB"""
-    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
\ No newline at end of file
+    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+# --- CONFIGURATION EMBEDDINGS & CACHES ---
+# Modèle ONNX utilisé par défaut par Chroma (sert aussi de clé pour le cache d'embeddings)
+EMBEDDING_MODEL_ID = "all-MiniLM-L6-v2"
+CACHE_DIR = os.getenv("CACHE_DIR", "local_cache")
+
+# --- CONFIGURATION INDEX LEXICAL (BM25 / FTS5) ---
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "local_lexical_index.db")
+
+_embedding_function = None
+
+def get_embedding_function():
+    """Retourne la fonction d'embedding partagée (chargée une seule fois)"""
+    global _embedding_function
+    if _embedding_function is None:
+        from chromadb.utils import embedding_functions
+        _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return _embedding_function
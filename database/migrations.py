@@ -0,0 +1,165 @@
+import logging
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+def _has_unique_index(conn, table: str, columns: list, exclude: str = "") -> bool:
+    """Vrai si un index unique (contrainte UNIQUE incluse) porte exactement sur ces colonnes, dans cet ordre."""
+    for index in conn.execute(text(f"PRAGMA index_list('{table}')")).mappings():
+        if not index["unique"] or index["name"] == exclude:
+            continue
+        indexed = [row["name"] for row in conn.execute(text(f"PRAGMA index_info('{index['name']}')")).mappings()]
+        if indexed == columns:
+            return True
+    return False
+
+def migrate_doc_keys(engine):
+    """
+    Migration idempotente de la table 'docs' (bases créées avant la contrainte d'unicité) :
+    1. ajout + remplissage de la colonne doc_key
+    2. suppression des doublons (employee, doc) en gardant la ligne la plus récente
+    3. création de l'index unique (employee, doc) et de l'index (employee, doc_key)
+    """
+    inspector = inspect(engine)
+    if "docs" not in inspector.get_table_names():
+        return
+
+    columns = {c["name"] for c in inspector.get_columns("docs")}
+    with engine.begin() as conn:
+        if "doc_key" not in columns:
+            logger.info("🛠️ [Migration] Ajout de la colonne docs.doc_key")
+            conn.execute(text("ALTER TABLE docs ADD COLUMN doc_key VARCHAR"))
+
+        conn.execute(text("UPDATE docs SET doc_key = rtrim(doc, '/') WHERE doc_key IS NULL"))
+
+        duplicates = conn.execute(text("""
+            DELETE FROM docs WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY employee, doc ORDER BY date_update DESC, id DESC
+                    ) AS rn FROM docs
+                ) WHERE rn = 1
+            )
+        """)).rowcount
+        if duplicates:
+            logger.warning(f"🛠️ [Migration] {duplicates} doublon(s) (employee, doc) supprimé(s)")
+
+        # create_all crée déjà UNIQUE(employee, doc) (sqlite_autoindex_docs_N) : pas de second index,
+        # et suppression de celui ajouté par une version précédente de cette migration
+        if _has_unique_index(conn, "docs", ["employee", "doc"], exclude="uq_docs_employee_doc"):
+            conn.execute(text("DROP INDEX IF EXISTS uq_docs_employee_doc"))
+        else:
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_docs_employee_doc ON docs (employee, doc)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_docs_employee_doc_key ON docs (employee, doc_key)"))
+
+def migrate_api_logs_index(engine):
+    """Index (employee, start_time) sur api_logs pour les bases existantes."""
+    if "api_logs" not in inspect(engine).get_table_names():
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_api_logs_employee_start_time ON api_logs (employee, start_time)"
+        ))
+
+def migrate_credit_usage(engine):
+    """
+    Réconcilie le compteur credit_usage du mois courant depuis api_logs.
+    Couvre le backfill des bases existantes et une éventuelle dérive entre deux démarrages.
+    """
+    if "api_logs" not in inspect(engine).get_table_names():
+        return
+    from repositories.credits import credits_repository
+    credits_repository.reconcile_usage()
+
+def migrate_router_decisions(engine):
+    """
+    Dédoublonnage des décisions du routeur (bases créées avant la colonne query_hash) :
+    1. ajout + remplissage de query_hash (requête normalisée)
+    2. suppression des doublons en gardant la décision la plus ancienne
+    3. index unique sur query_hash
+    """
+    inspector = inspect(engine)
+    if "router_decisions" not in inspector.get_table_names():
+        return
+
+    from repositories.router_decision import query_hash
+
+    columns = {c["name"] for c in inspector.get_columns("router_decisions")}
+    with engine.begin() as conn:
+        if "query_hash" not in columns:
+            logger.info("🛠️ [Migration] Ajout de la colonne router_decisions.query_hash")
+            conn.execute(text("ALTER TABLE router_decisions ADD COLUMN query_hash VARCHAR"))
+
+        rows = conn.execute(text("SELECT id, query FROM router_decisions WHERE query_hash IS NULL")).all()
+        if rows:
+            conn.execute(
+                text("UPDATE router_decisions SET query_hash = :hash WHERE id = :id"),
+                [{"hash": query_hash(query), "id": row_id} for row_id, query in rows]
+            )
+
+        duplicates = conn.execute(text("""
+            DELETE FROM router_decisions WHERE id NOT IN (
+                SELECT MIN(id) FROM router_decisions GROUP BY query_hash
+            )
+        """)).rowcount
+        if duplicates:
+            logger.warning(f"🛠️ [Migration] {duplicates} décision(s) routeur en double supprimée(s)")
+
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_router_decisions_query_hash ON router_decisions (query_hash)"
+        ))
+
+def _run_once(engine, name: str, migration) -> bool:
+    """
+    Exécute une migration de données une seule fois (table applied_migrations).
+    Si elle échoue, elle n'est pas marquée et sera retentée au prochain démarrage.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS applied_migrations (name VARCHAR PRIMARY KEY, applied_at DATETIME)"
+        ))
+        if conn.execute(text("SELECT 1 FROM applied_migrations WHERE name = :name"), {"name": name}).first():
+            return False
+
+    migration()
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT OR IGNORE INTO applied_migrations (name, applied_at) VALUES (:name, CURRENT_TIMESTAMP)"),
+            {"name": name}
+        )
+    return True
+
+def migrate_doc_tags(engine):
+    """
+    Remplissage initial de la table doc_tags depuis la colonne JSON docs.tags (bases existantes).
+    Ensuite la table est tenue à jour par DocRepository à chaque écriture.
+    """
+    if "docs" not in inspect(engine).get_table_names():
+        return
+
+    from repositories.doc import doc_repository
+    if _run_once(engine, "doc_tags_backfill", doc_repository.backfill_doc_tags):
+        logger.info("🛠️ [Migration] Table doc_tags remplie depuis docs.tags")
+
+def migrate_chunk_filters(engine):
+    """
+    Backfill des champs filtrables (doc_status, category, tag:<tag>) sur les chunks Chroma existants.
+    Sans lui, le pushdown (CHROMA_FILTER_PUSHDOWN, actif par défaut) filtre sur doc_status = 'Done'
+    et ne renvoie aucun chunk indexé avant son introduction.
+    """
+    from repositories.chunk import CHROMA_FILTER_PUSHDOWN
+    if not CHROMA_FILTER_PUSHDOWN or "docs" not in inspect(engine).get_table_names():
+        return
+
+    from repositories.doc import doc_repository
+    if _run_once(engine, "chunk_filters_backfill", doc_repository.sync_all_chunk_filters):
+        logger.info("🛠️ [Migration] Champs filtrables reportés sur les chunks existants")
+
+def run_migrations(engine):
+    migrate_doc_keys(engine)
+    migrate_api_logs_index(engine)
+    migrate_router_decisions(engine)
+    migrate_credit_usage(engine)
+    migrate_doc_tags(engine)
+    migrate_chunk_filters(engine)
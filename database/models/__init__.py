@@ -4,5 +4,8 @@ from .doc import DocModel
 from .log import ApiLogModel
 from .prompt import PromptModel
 from .doc_category import DocCategoryModel
+from .router_decision import RouterDecisionModel
+from .doc_tag import DocTagModel
+from .credit_usage import CreditUsageModel
 
-__all__ = ["Base", "LoginModel", "DocModel", "ApiLogModel", "PromptModel", "DocCategoryModel"]
\ No newline at end of file
+__all__ = ["Base", "LoginModel", "DocModel", "ApiLogModel", "PromptModel", "DocCategoryModel", "RouterDecisionModel", "DocTagModel", "CreditUsageModel"]
\ No newline at end of file
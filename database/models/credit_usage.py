@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint
+from datetime import datetime
+from .base import Base
+
+class CreditUsageModel(Base):
+    """Compteur matérialisé : somme des api_logs.total_cost > 0 par employee et par mois (UTC)."""
+    __tablename__ = "credit_usage"
+    __table_args__ = (
+        UniqueConstraint("employee", "month", name="uq_credit_usage_employee_month"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    employee = Column(String, nullable=False)
+    month = Column(String, nullable=False) # 'YYYY-MM'
+    total_cost = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
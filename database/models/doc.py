@@ -1,12 +1,22 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text, UniqueConstraint, Index
+from sqlalchemy.orm import deferred
 from datetime import datetime
 from .base import Base
 
+def make_doc_key(doc_id: str) -> str:
+    """Clé normalisée d'un doc : 'https://x.com/' et 'https://x.com' partagent la même clé."""
+    return doc_id.rstrip("/") if doc_id else doc_id
+
 class DocModel(Base):
     __tablename__ = "docs"
+    __table_args__ = (
+        UniqueConstraint("employee", "doc", name="uq_docs_employee_doc"),
+        Index("ix_docs_employee_doc_key", "employee", "doc_key"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     doc = Column(String, index=True, nullable=False)
+    doc_key = Column(String, nullable=True) # make_doc_key(doc), lookup unique de la variante avec/sans slash
     category = Column(String, nullable=False)
     date_init = Column(DateTime, default=datetime.utcnow)
     source = Column(String, nullable=False)
@@ -18,8 +28,9 @@ class DocModel(Base):
     status = Column(String, default="Processing")
     employee = Column(String, index=True, nullable=False)
     job_id = Column(String, nullable=False)
-    page_content = Column(JSON, nullable=False)
-    previous_page_content = Column(JSON, nullable=True)
+    # Documents complets (texte intégral des PDF...) : chargés uniquement à la demande (undefer / projection)
+    page_content = deferred(Column(JSON, nullable=False))
+    previous_page_content = deferred(Column(JSON, nullable=True))
     date_update = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     modified_fields = Column(String, nullable=True)
     name = Column(String, nullable=True)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Index
+from .base import Base
+
+class DocTagModel(Base):
+    """Table d'association normalisée (employee, tag, doc) : filtres et comptages par tag indexés."""
+    __tablename__ = "doc_tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    employee = Column(String, nullable=False)
+    doc = Column(String, nullable=False)
+    tag = Column(String, nullable=False)       # Libellé d'origine (affichage / comptage)
+    tag_norm = Column(String, nullable=False)  # Minuscule + strip (filtrage)
+
+    __table_args__ = (
+        Index("ix_doc_tags_employee_tag_norm", "employee", "tag_norm", "doc"),
+        Index("ix_doc_tags_employee_tag", "employee", "tag"),
+        Index("ix_doc_tags_employee_doc", "employee", "doc"),
+    )
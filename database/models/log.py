@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON, Index
 from datetime import datetime
 from .base import Base
 
 class ApiLogModel(Base):
     __tablename__ = "api_logs"
+    __table_args__ = (
+        # Réconciliation des compteurs mensuels (credit_usage)
+        Index("ix_api_logs_employee_start_time", "employee", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     start_time = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text
+from datetime import datetime
+from .base import Base
+
+class RouterDecisionModel(Base):
+    __tablename__ = "router_decisions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    query = Column(Text, nullable=False)
+    # Hash de la requête normalisée : une seule décision par question (pas de biais par répétition)
+    query_hash = Column(String, unique=True, index=True)
+    decision = Column(String, index=True, nullable=False) # GLOBAL | SPECIFIC
+    embedding = Column(JSON, nullable=False)
+    source = Column(String, default="llm")
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,18 +1,169 @@
-import uuid
+import os
+import hashlib
 import logging
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional
 from schemas.doc import Chunk as ChunkSchema
-from database.connection import get_chroma_client
+from database.connection import get_chroma_client, get_embedding_function
+from repositories.embedding_cache import embedding_cache_repository
+from repositories.lexical_index import lexical_index_repository
+from repositories.rerank_cache import rerank_cache_repository
+from repositories.doc_catalog import doc_catalog_repository, normalize_tag
+from utils.text_hash import content_hash
+from utils.rank_fusion import reciprocal_rank_fusion
 
 logger = logging.getLogger(__name__)
 
+# Filtres tags / catégorie / statut portés par les métadonnées des chunks (clause where Chroma)
+# plutôt qu'une liste {"doc": {"$in": [...]}} résolue en SQL. Les chunks d'une base existante
+# sont complétés une fois au démarrage (database/migrations.migrate_chunk_filters).
+CHROMA_FILTER_PUSHDOWN = os.getenv("CHROMA_FILTER_PUSHDOWN", "true").lower() == "true"
+TAG_KEY_PREFIX = "tag:"
+
+# Sharding optionnel : une collection Chroma par tenant (index HNSW proportionnel à son corpus).
+# - none     : collection unique partagée (historique)
+# - employee : une collection par employee
+# - domain   : une collection par domaine email (ex. toute une entreprise)
+# Migration d'une base existante : scripts/shard_chroma_collection.py
+BASE_COLLECTION = "rag_chunks"
+CHROMA_SHARDING = os.getenv("CHROMA_SHARDING", "none").lower()
+
+# Métadonnées réalignées sur les chunks inchangés lors d'une ré-ingestion incrémentale
+SYNC_PATCHED_KEYS = ("chunk_index", "index", "tags", "category")
+
 class ChunkRepository:
     def __init__(self):
         self.client = get_chroma_client()
+        self.embedding_function = get_embedding_function()
+        # Handles de collections mis en cache (évite un get_or_create_collection à chaque accès)
+        self._collections: Dict[str, object] = {}
+        self._collections_lock = threading.Lock()
+
+    @staticmethod
+    def tenant_key(employee: str) -> str:
+        if CHROMA_SHARDING == "domain" and "@" in employee:
+            return employee.rsplit("@", 1)[1].lower()
+        return employee
+
+    def collection_name(self, employee: Optional[str] = None) -> str:
+        if CHROMA_SHARDING == "none" or employee is None:
+            return BASE_COLLECTION
+        # Nom stable et valide pour Chroma (3-63 caractères alphanumériques), quel que soit l'employee
+        digest = hashlib.sha256(self.tenant_key(employee).encode("utf-8")).hexdigest()[:16]
+        return f"{BASE_COLLECTION}_{digest}"
+
+    def get_collection(self, employee: Optional[str] = None):
+        name = self.collection_name(employee)
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._collections_lock:
+                collection = self._collections.get(name)
+                if collection is None:
+                    collection = self.client.get_or_create_collection(name=name, embedding_function=self.embedding_function)
+                    self._collections[name] = collection
+        return collection
+
+    def reset_collections(self):
+        """À appeler si des collections sont supprimées/recréées hors de ce process (handles périmés)."""
+        with self._collections_lock:
+            self._collections.clear()
+
+    def list_collection_names(self) -> List[str]:
+        """Collection partagée + shards existants."""
+        names = [getattr(c, "name", c) for c in self.client.list_collections()]
+        return [n for n in names if n == BASE_COLLECTION or n.startswith(f"{BASE_COLLECTION}_")]
 
     @property
     def collection(self):
-        return self.client.get_or_create_collection(name="rag_chunks")
+        """Collection partagée historique (mode sans sharding)."""
+        return self.get_collection()
+
+    def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """
+        Calcule les embeddings en passant par le cache disque (hash contenu + modèle).
+        Seuls les textes absents du cache sont envoyés au modèle, en un seul batch.
+        """
+        embeddings = embedding_cache_repository.get_many(documents)
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+
+        if missing:
+            missing_texts = [documents[i] for i in missing]
+            fresh = [[float(x) for x in emb] for emb in self.embedding_function(missing_texts)]
+            embedding_cache_repository.set_many(missing_texts, fresh)
+            for i, emb in zip(missing, fresh):
+                embeddings[i] = emb
+
+        logger.info(f"🧮 [Embeddings] {len(documents) - len(missing)}/{len(documents)} servis par le cache")
+        return embeddings
+
+    @staticmethod
+    def _chunk_ids(doc_id: str, employee: str, chunks: List[ChunkSchema]) -> List[str]:
+        """
+        IDs déterministes : doc + hash (employee, contenu brut avant enrichissement).
+        L'employee entre dans le hash car deux utilisateurs peuvent ingérer la même URL.
+        Un même contenu répété dans le doc reçoit un suffixe d'occurrence.
+        """
+        ids = []
+        occurrences: Dict[str, int] = {}
+        for chunk in chunks:
+            h = chunk.metadata.get("content_hash") or content_hash(chunk.content)
+            n = occurrences.get(h, 0)
+            occurrences[h] = n + 1
+            scoped = hashlib.sha256(f"{employee}:{h}".encode("utf-8")).hexdigest()
+            ids.append(f"{doc_id}_{scoped[:16]}" + (f"_{n}" if n else ""))
+        return ids
+
+    @staticmethod
+    def _clean_metadata(chunk: ChunkSchema, doc_id: str, employee: str) -> dict:
+        meta = chunk.metadata.copy()
+        meta["doc"] = doc_id
+        meta["employee"] = employee
+        meta.setdefault("content_hash", content_hash(chunk.content))
+
+        clean_meta = {}
+        for k, v in meta.items():
+            if isinstance(v, list):
+                clean_meta[k] = ",".join(map(str, v))
+            elif v is None:
+                clean_meta[k] = ""
+            else:
+                clean_meta[k] = v
+        return clean_meta
+
+    @staticmethod
+    def doc_filter_fields(status: str, category: str, tags) -> dict:
+        """Champs filtrables d'un doc : statut, catégorie et une clé booléenne par tag normalisé."""
+        fields = {"doc_status": status or "", "category": category or ""}
+        for tag in tags or []:
+            tag_norm = normalize_tag(tag)
+            if tag_norm:
+                fields[TAG_KEY_PREFIX + tag_norm] = True
+        return fields
+
+    def _update_lexical_index(self, operation, *args):
+        """L'index lexical (BM25) est secondaire : une erreur ne doit pas casser l'ingestion."""
+        try:
+            operation(*args)
+        except Exception as e:
+            logger.warning(f"⚠️ Erreur mise à jour index lexical : {e}")
+
+    def _insert(self, doc_id: str, employee: str, ids: List[str], chunks: List[ChunkSchema]):
+        documents = [chunk.content for chunk in chunks]
+        metadatas = [self._clean_metadata(chunk, doc_id, employee) for chunk in chunks]
+
+        entry = doc_catalog_repository.get_entry(employee, doc_id)
+        if entry is not None:
+            fields = self.doc_filter_fields(entry.status, entry.category, entry.tags)
+            for meta in metadatas:
+                meta.update(fields)
+
+        self.get_collection(employee).add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=self._embed_documents(documents)
+        )
+        self._update_lexical_index(lexical_index_repository.add_chunks, employee, doc_id, ids, documents, metadatas)
 
     def add_chunks(self, doc_id: str, employee: str, chunks: List[ChunkSchema]):
         if not chunks:
@@ -20,61 +171,156 @@ class ChunkRepository:
 
         self.delete_chunks_by_doc(doc_id, employee)
 
-        ids = []
-        documents = []
-        metadatas = []
-        
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_{i}_{str(uuid.uuid4())[:8]}"
-            ids.append(chunk_id)
-            documents.append(chunk.content)
-            
-            meta = chunk.metadata.copy()
-            meta["doc"] = doc_id
-            meta["employee"] = employee
-            
-            clean_meta = {}
-            for k, v in meta.items():
-                if isinstance(v, list):
-                    clean_meta[k] = ",".join(map(str, v))
-                elif v is None:
-                    clean_meta[k] = ""
-                else:
-                    clean_meta[k] = v
-            metadatas.append(clean_meta)
+        ids = self._chunk_ids(doc_id, employee, chunks)
 
         try:
-            self.collection.add(
-                ids=ids,
-                documents=documents,
-                metadatas=metadatas
-            )
+            self._insert(doc_id, employee, ids, chunks)
             logger.info(f"✅ [Chroma] {len(ids)} chunks ajoutés pour {doc_id}")
         except Exception as e:
             logger.error(f"❌ Erreur ajout Chroma : {e}")
             raise e
 
-    def search(self, query: str, employee: str, limit: int = 5, doc_ids_filter: Optional[List[str]] = None):
+    def sync_chunks(self, doc_id: str, employee: str, chunks: List[ChunkSchema]) -> dict:
+        """
+        Ré-ingestion incrémentale : diff entre les chunks stockés et les nouveaux.
+        - nouveaux/modifiés -> ajoutés (embeddings calculés)
+        - disparus -> supprimés
+        - inchangés -> vecteurs et enrichissement conservés ; position, tags et catégorie sont patchés
+        """
+        new_ids = self._chunk_ids(doc_id, employee, chunks)
+        rerank_cache_repository.invalidate_doc(doc_id, employee)
+
+        existing = self.get_collection(employee).get(
+            where={"$and": [{"doc": doc_id}, {"employee": employee}]},
+            include=["metadatas"]
+        )
+        existing_meta = dict(zip(existing["ids"], existing["metadatas"]))
+        new_id_set = set(new_ids)
+
+        to_delete = [cid for cid in existing_meta if cid not in new_id_set]
+        to_add_ids, to_add_chunks = [], []
+        to_update_ids, to_update_metas = [], []
+
+        for cid, chunk in zip(new_ids, chunks):
+            old_meta = existing_meta.get(cid)
+            if old_meta is None:
+                to_add_ids.append(cid)
+                to_add_chunks.append(chunk)
+                continue
+
+            # Chunk inchangé : on ne patche que la position et les tags/catégorie s'ils ont bougé
+            new_meta = self._clean_metadata(chunk, doc_id, employee)
+            patch = {
+                key: new_meta[key]
+                for key in SYNC_PATCHED_KEYS
+                if key in new_meta and old_meta.get(key) != new_meta[key]
+            }
+            if patch:
+                to_update_ids.append(cid)
+                to_update_metas.append({**old_meta, **patch})
+
         try:
-            # Construction de la clause WHERE
-            conditions = [{"employee": employee}]
-            
-            # LOGIQUE CRITIQUE ICI : Si filtre demandé mais liste vide -> 0 résultat garanti
-            if doc_ids_filter is not None:
-                if len(doc_ids_filter) == 0:
-                    logger.warning(f"⚠️ [ChunkRepo] Filtre doc_ids activé mais VIDE. Retour immédiat de 0 résultats.")
-                    return {"ids": [], "documents": [], "metadatas": [], "distances": []}
-                
-                conditions.append({"doc": {"$in": doc_ids_filter}})
-
-            if len(conditions) > 1:
-                where_clause = {"$and": conditions}
-            else:
-                where_clause = conditions[0]
+            if to_delete:
+                self.get_collection(employee).delete(ids=to_delete)
+                self._update_lexical_index(lexical_index_repository.delete_ids, to_delete)
+            if to_update_ids:
+                self.get_collection(employee).update(ids=to_update_ids, metadatas=to_update_metas)
+                self._update_lexical_index(lexical_index_repository.update_metadata, to_update_ids, to_update_metas)
+            if to_add_ids:
+                self._insert(doc_id, employee, to_add_ids, to_add_chunks)
+        except Exception as e:
+            logger.error(f"❌ Erreur synchro Chroma : {e}")
+            raise e
+
+        stats = {
+            "added": len(to_add_ids),
+            "updated": len(to_update_ids),
+            "deleted": len(to_delete),
+            "kept": len(new_ids) - len(to_add_ids)
+        }
+        logger.info(f"🔁 [Chroma] Synchro incrémentale {doc_id} : {stats}")
+        return stats
+
+    def sync_doc_filters(self, doc_id: str, employee: str, status: str, category: str, tags) -> int:
+        """
+        Réécrit les champs filtrables sur tous les chunks d'un doc (ingestion, changement de statut).
+        Les tags retirés passent à False plutôt que d'être supprimés (update Chroma = fusion de clés).
+        """
+        try:
+            existing = self.get_collection(employee).get(
+                where={"$and": [{"doc": doc_id}, {"employee": employee}]},
+                include=["metadatas"]
+            )
+            if not existing["ids"]:
+                return 0
+
+            fields = self.doc_filter_fields(status, category, tags)
+            metadatas = []
+            for meta in existing["metadatas"]:
+                new_meta = dict(meta or {})
+                for key in new_meta:
+                    if key.startswith(TAG_KEY_PREFIX):
+                        new_meta[key] = False
+                new_meta.update(fields)
+                metadatas.append(new_meta)
+
+            self.get_collection(employee).update(ids=existing["ids"], metadatas=metadatas)
+            self._update_lexical_index(lexical_index_repository.update_metadata, existing["ids"], metadatas)
+            return len(existing["ids"])
+        except Exception as e:
+            logger.warning(f"⚠️ Erreur synchro filtres chunks {doc_id} : {e}")
+            return 0
+
+    @staticmethod
+    def _tag_keys(tags) -> List[str]:
+        """Clés de métadonnées tag:<tag normalisé> (dédoublonnées) pour les tags demandés."""
+        if isinstance(tags, str):
+            tags = [tags]
+        return list(dict.fromkeys(TAG_KEY_PREFIX + normalize_tag(t) for t in tags or [] if normalize_tag(t)))
+
+    def _build_where(self, employee: str, doc_ids_filter: Optional[List[str]] = None,
+                     tags: Optional[List[str]] = None, exclude_categories: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Construit la clause WHERE Chroma.
+        - tags / exclude_categories : filtrés directement sur les métadonnées des chunks
+          (sans tag demandé, aucun filtre par doc n'est appliqué)
+        - doc_ids_filter : liste explicite de docs (mode historique, sans pushdown)
+        Retourne None si un filtre doc_ids est demandé mais vide (-> 0 résultat garanti).
+        """
+        conditions = [{"employee": employee}]
+
+        if doc_ids_filter is not None:
+            if len(doc_ids_filter) == 0:
+                logger.warning(f"⚠️ [ChunkRepo] Filtre doc_ids activé mais VIDE. Retour immédiat de 0 résultats.")
+                return None
+
+            conditions.append({"doc": {"$in": doc_ids_filter}})
+        else:
+            conditions.append({"doc_status": "Done"})
+
+            tag_keys = self._tag_keys(tags)
+            if len(tag_keys) == 1:
+                conditions.append({tag_keys[0]: True})
+            elif tag_keys:
+                conditions.append({"$or": [{key: True} for key in tag_keys]})
+
+        if exclude_categories:
+            conditions.append({"category": {"$nin": list(exclude_categories)}})
+
+        if len(conditions) > 1:
+            return {"$and": conditions}
+        return conditions[0]
+
+    def search(self, query: str, employee: str, limit: int = 5, doc_ids_filter: Optional[List[str]] = None,
+               tags: Optional[List[str]] = None, exclude_categories: Optional[List[str]] = None):
+        try:
+            where_clause = self._build_where(employee, doc_ids_filter, tags, exclude_categories)
+            if where_clause is None:
+                return {"ids": [], "documents": [], "metadatas": [], "distances": []}
 
             logger.info(f"🔍 [ChunkRepo] Query Chroma: '{query}' | Where: {where_clause}")
 
-            results = self.collection.query(
+            results = self.get_collection(employee).query(
                 query_texts=[query],
                 n_results=limit,
                 where=where_clause
@@ -84,12 +330,72 @@ class ChunkRepository:
             logger.error(f"❌ Erreur recherche Chroma : {e}")
             return {"ids": [], "documents": [], "metadatas": [], "distances": []}
 
+    def search_many(self, queries: List[str], employee: str, limit: int = 5, doc_ids_filter: Optional[List[str]] = None,
+                    tags: Optional[List[str]] = None, exclude_categories: Optional[List[str]] = None) -> dict:
+        """
+        Recherche multi-requêtes en UN seul appel Chroma (embeddings calculés en un batch).
+        Retourne :
+        - "queries" : résultats bruts par requête (même format que search(), sans la dimension batch)
+        - "fused"   : classement fusionné (RRF), chunks dédupliqués par id
+        """
+        queries = [q for q in queries if q and q.strip()]
+        empty = {"queries": [{"ids": [], "documents": [], "metadatas": [], "distances": []} for _ in queries], "fused": []}
+        if not queries:
+            return empty
+
+        try:
+            where_clause = self._build_where(employee, doc_ids_filter, tags, exclude_categories)
+            if where_clause is None:
+                return empty
+
+            logger.info(f"🔍 [ChunkRepo] Multi-query Chroma ({len(queries)} requêtes) | Where: {where_clause}")
+
+            results = self.get_collection(employee).query(
+                query_texts=queries,
+                n_results=limit,
+                where=where_clause
+            )
+        except Exception as e:
+            logger.error(f"❌ Erreur recherche Chroma : {e}")
+            return empty
+
+        per_query = []
+        chunks_by_id = {}
+        for q_idx in range(len(queries)):
+            ids = results["ids"][q_idx]
+            documents = results["documents"][q_idx]
+            metadatas = results["metadatas"][q_idx]
+            distances = results["distances"][q_idx] if results.get("distances") else [None] * len(ids)
+            per_query.append({"ids": ids, "documents": documents, "metadatas": metadatas, "distances": distances})
+
+            for cid, doc, meta, dist in zip(ids, documents, metadatas, distances):
+                known = chunks_by_id.get(cid)
+                # On garde la meilleure distance observée pour un même chunk
+                if known is None or (dist is not None and (known["distance"] is None or dist < known["distance"])):
+                    chunks_by_id[cid] = {"id": cid, "document": doc, "metadata": meta, "distance": dist}
+
+        fused = []
+        for cid, rrf_score in reciprocal_rank_fusion([r["ids"] for r in per_query]):
+            fused.append({**chunks_by_id[cid], "rrf_score": rrf_score})
+
+        return {"queries": per_query, "fused": fused}
+
+    def lexical_search(self, query: str, employee: str, limit: int = 20, doc_ids_filter: Optional[List[str]] = None,
+                       tags: Optional[List[str]] = None, exclude_categories: Optional[List[str]] = None) -> List[dict]:
+        """Recherche BM25 sur l'index lexical (mêmes règles de filtrage que search)."""
+        return lexical_index_repository.search(
+            query, employee, limit=limit, doc_ids_filter=doc_ids_filter,
+            tag_keys=self._tag_keys(tags), exclude_categories=exclude_categories
+        )
+
     def delete_chunks_by_doc(self, doc_id: str, employee: str):
         try:
-            self.collection.delete(
+            self.get_collection(employee).delete(
                 where={"$and": [{"doc": doc_id}, {"employee": employee}]}
             )
         except Exception as e:
             logger.warning(f"⚠️ Erreur suppression chunks (peut-être vides) : {e}")
+        self._update_lexical_index(lexical_index_repository.delete_doc, doc_id, employee)
+        rerank_cache_repository.invalidate_doc(doc_id, employee)
 
 chunk_repository = ChunkRepository()
\ No newline at end of file
@@ -1,40 +1,123 @@
-from repositories.user import user_repository
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
 from repositories.base import BaseRepository
 from database.models.log import ApiLogModel
-from sqlalchemy import func
-from datetime import datetime
+from database.models.user import LoginModel
+from database.models.credit_usage import CreditUsageModel
+
+logger = logging.getLogger(__name__)
+
+def month_key(when: datetime) -> str:
+    return when.strftime("%Y-%m")
 
 class CreditsRepository(BaseRepository):
-    
+    """
+    L'usage du mois est lu dans le compteur matérialisé credit_usage (mis à jour à l'écriture des logs),
+    avec un petit cache process (TTL court) : plus de SUM(api_logs) à chaque requête.
+    """
+
+    def __init__(self):
+        self.cache_ttl_seconds = float(os.getenv("CREDITS_CACHE_TTL_SECONDS", "5"))
+        self._cache: dict[str, tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
     def get_current_credit(self, employee: str) -> dict:
         """
         Replique de creditsRepository.getCurrentCredit()
         Retourne { currentUsage, totalCredit }
         """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(employee)
+            if cached and cached[0] > now:
+                return dict(cached[1])
+
         with self.get_session() as db:
-            # 1. Récupérer Total Credit (User)
-            user = user_repository.get_by_employee(employee)
-            total_credit = user.credit if user else 0
-            
-            # 2. Calculer Current Usage (Somme des coûts du mois)
-            # Simplifié pour l'instant : on compte juste les logs ou on met 0
-            # Pour faire EXACTEMENT comme Node, il faudrait sommer api_logs.total_cost
-            
-            # Exemple simple : Somme des coûts > 0 ce mois-ci
-            now = datetime.utcnow()
-            start_of_month = datetime(now.year, now.month, 1)
-            
-            usage_query = db.query(func.sum(ApiLogModel.total_cost)).filter(
-                ApiLogModel.employee == employee,
-                ApiLogModel.total_cost > 0,
-                ApiLogModel.start_time >= start_of_month
+            # 1. Total Credit (User) et 2. Usage du mois : deux lectures indexées, une seule session
+            total_credit = db.query(LoginModel.credit).filter(LoginModel.employee == employee).scalar()
+            current_usage = db.query(CreditUsageModel.total_cost).filter(
+                CreditUsageModel.employee == employee,
+                CreditUsageModel.month == month_key(datetime.utcnow())
             ).scalar()
-            
-            current_usage = usage_query if usage_query else 0
 
-            return {
-                "currentUsage": current_usage,
-                "totalCredit": total_credit
+        result = {
+            "currentUsage": current_usage if current_usage else 0,
+            "totalCredit": total_credit if total_credit else 0
+        }
+        with self._lock:
+            self._cache[employee] = (now + self.cache_ttl_seconds, result)
+        return dict(result)
+
+    def increment_usage(self, db, costs: dict[tuple[str, str], float]):
+        """
+        Incrémente les compteurs {(employee, 'YYYY-MM'): coût} dans la transaction de l'appelant
+        (celle qui insère les logs), via INSERT ... ON CONFLICT DO UPDATE.
+        L'appelant invalide le cache après commit.
+        """
+        for (employee, month), cost in costs.items():
+            if not cost or cost <= 0:
+                continue
+            stmt = sqlite_insert(CreditUsageModel).values(
+                employee=employee, month=month, total_cost=cost, updated_at=datetime.utcnow()
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CreditUsageModel.employee, CreditUsageModel.month],
+                set_={
+                    "total_cost": CreditUsageModel.total_cost + stmt.excluded.total_cost,
+                    "updated_at": stmt.excluded.updated_at
+                }
+            )
+            db.execute(stmt)
+
+    def invalidate(self, employee: str):
+        with self._lock:
+            self._cache.pop(employee, None)
+
+    def reconcile_usage(self, month: str | None = None) -> int:
+        """
+        Recalcule les compteurs d'un mois depuis api_logs (index employee/start_time).
+        Sert au backfill initial et à corriger une éventuelle dérive.
+        Une seule instruction INSERT ... SELECT ... ON CONFLICT DO UPDATE : pas de fenêtre
+        DELETE/INSERT pendant laquelle un increment_usage concurrent serait perdu.
+        """
+        month = month or month_key(datetime.utcnow())
+        start = datetime.strptime(month, "%Y-%m")
+        end = datetime(start.year + (start.month == 12), start.month % 12 + 1, 1)
+
+        totals = select(
+            ApiLogModel.employee,
+            literal(month),
+            func.sum(ApiLogModel.total_cost),
+            literal(datetime.utcnow())
+        ).where(
+            ApiLogModel.total_cost > 0,
+            ApiLogModel.start_time >= start,
+            ApiLogModel.start_time < end
+        ).group_by(ApiLogModel.employee)
+
+        stmt = sqlite_insert(CreditUsageModel).from_select(
+            ["employee", "month", "total_cost", "updated_at"], totals
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CreditUsageModel.employee, CreditUsageModel.month],
+            set_={
+                "total_cost": stmt.excluded.total_cost,
+                "updated_at": stmt.excluded.updated_at
             }
+        )
+
+        with self.get_session() as db:
+            count = db.execute(stmt).rowcount
+
+        with self._lock:
+            self._cache.clear()
+        logger.info(f"✅ [Credits] Compteurs {month} réconciliés pour {count} employee(s).")
+        return count
 
-credits_repository = CreditsRepository()
\ No newline at end of file
+credits_repository = CreditsRepository()
@@ -1,105 +1,154 @@
 from datetime import datetime
-from collections import Counter
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import logging
 
-from database.models.doc import DocModel
+from database.models.doc import DocModel, make_doc_key
 from database.models.doc_category import DocCategoryModel 
+from database.models.doc_tag import DocTagModel
 from schemas.doc import DocCreate, DocResponse 
 from .base import BaseRepository
+from .doc_catalog import doc_catalog_repository, normalize_tag
 
 logger = logging.getLogger(__name__)
 
 class DocRepository(BaseRepository):
+
+    # Colonnes mises à jour quand le doc existe déjà (les autres ne sont posées qu'à la création)
+    UPSERT_UPDATE_COLUMNS = (
+        "category", "tags", "synthesis", "suggested_tags", "quality",
+        "page_content", "status", "date_update", "doc_key"
+    )
+    # Lignes par instruction INSERT multi-valeurs (reste sous la limite de variables SQLite)
+    UPSERT_BATCH_SIZE = 200
+
+    @staticmethod
+    def _sync_tags(db, employee: str, doc_id: str, tags: list | None):
+        """Réécrit les lignes doc_tags d'un document (même transaction que le doc)."""
+        db.query(DocTagModel).filter(
+            DocTagModel.employee == employee,
+            DocTagModel.doc == doc_id
+        ).delete(synchronize_session=False)
+
+        tag_list = tags if isinstance(tags, list) else []
+        for tag in dict.fromkeys(str(t) for t in tag_list):
+            if not tag.strip():
+                continue
+            db.add(DocTagModel(employee=employee, doc=doc_id, tag=tag, tag_norm=normalize_tag(tag)))
+
+    def backfill_doc_tags(self) -> int:
+        """Migration : reconstruit toute la table doc_tags depuis la colonne JSON DocModel.tags."""
+        with self.get_session() as db:
+            db.query(DocTagModel).delete(synchronize_session=False)
+            rows = db.query(DocModel.employee, DocModel.doc, DocModel.tags).all()
+            for employee, doc_id, tags in rows:
+                self._sync_tags(db, employee, doc_id, tags)
+            return len(rows)
     
-    def get_doc(self, doc_id: str, employee: str) -> DocResponse | None:
+    @staticmethod
+    def _sync_chunk_filters(employee: str, doc_id: str):
+        """Reporte statut / catégorie / tags du doc dans les métadonnées Chroma de ses chunks."""
+        from repositories.chunk import chunk_repository
+
+        entry = doc_catalog_repository.get_entry(employee, doc_id)
+        if entry is not None:
+            chunk_repository.sync_doc_filters(doc_id, employee, entry.status, entry.category, entry.tags)
+
+    def sync_all_chunk_filters(self) -> int:
+        """
+        Reporte statut / catégorie / tags de tous les docs sur leurs chunks (backfill du pushdown).
+        Idempotent : à relancer sans risque. Retourne le nombre de chunks mis à jour.
+        """
+        from repositories.chunk import chunk_repository
+
         with self.get_session() as db:
-            doc = db.query(DocModel).filter(
-                DocModel.doc == doc_id,
-                DocModel.employee == employee
-            ).first()
+            rows = db.query(DocModel.employee, DocModel.doc, DocModel.status, DocModel.category, DocModel.tags).all()
 
-            if not doc:
-                alt_id = doc_id[:-1] if doc_id.endswith("/") else doc_id + "/"
-                doc = db.query(DocModel).filter(
-                    DocModel.doc == alt_id,
-                    DocModel.employee == employee
-                ).first()
+        total = 0
+        for employee, doc_id, status, category, tags in rows:
+            tag_list = tags if isinstance(tags, list) else []
+            total += chunk_repository.sync_doc_filters(doc_id, employee, status, category, tag_list)
+        logger.info(f"✅ [DocRepo] Filtres reportés sur {total} chunks pour {len(rows)} documents.")
+        return total
+
+    def get_doc(self, doc_id: str, employee: str) -> DocResponse | None:
+        with self.get_session() as db:
+            # Lecture unitaire : seul endroit où le contenu complet est réellement nécessaire
+            full_doc = db.query(DocModel).options(
+                undefer(DocModel.page_content), undefer(DocModel.previous_page_content)
+            )
+            # Une seule recherche indexée sur doc_key (variantes avec/sans slash), l'id exact en priorité
+            doc = full_doc.filter(
+                DocModel.employee == employee,
+                DocModel.doc_key == make_doc_key(doc_id)
+            ).order_by((DocModel.doc == doc_id).desc()).first()
 
             if doc:
                 return DocResponse.model_validate(doc)
             return None
 
-    def get_filtered_doc_ids(self, employee: str, tags: list[str] = None, exclude_ids: list[str] = None) -> list[str]:
+    def get_filtered_doc_ids(self, employee: str, tags: list[str] = None, exclude_ids: list[str] = None,
+                             exclude_categories: list[str] = None) -> list[str]:
         """
         Récupère les IDs des documents qui correspondent aux tags ET qui ne sont pas exclus.
+        Servi par le catalogue mémoire (pas de requête SQL une fois le catalogue chargé).
         """
-        with self.get_session() as db:
-            # On récupère TOUS les docs "Done" de l'utilisateur pour filtrer en Python (plus simple pour les tags JSON)
-            query = db.query(DocModel).filter(
-                DocModel.employee == employee,
-                DocModel.status == "Done"
-            )
-            docs = query.all()
-            
-            valid_ids = []
-            target_tags = set(t.lower().strip() for t in tags) if tags else set()
-            excluded_set = set(exclude_ids) if exclude_ids else set()
-
-            logger.debug(f"🔎 [DocRepo] Filtrage tags: {target_tags} sur {len(docs)} docs candidats.")
-
-            for doc in docs:
-                if doc.doc in excluded_set:
-                    continue
-
-                # Si aucun tag demandé, on prend tout
-                if not target_tags:
-                    valid_ids.append(doc.doc)
-                    continue
-
-                # Vérification intersection
-                if doc.tags:
-                    # On s'assure que doc.tags est bien une liste de strings
-                    doc_tags_list = doc.tags if isinstance(doc.tags, list) else []
-                    doc_tags = set(str(t).lower().strip() for t in doc_tags_list)
-                    
-                    # Si au moins un tag correspond (intersection non vide)
-                    if not target_tags.isdisjoint(doc_tags):
-                        valid_ids.append(doc.doc)
-            
-            logger.info(f"✅ [DocRepo] {len(valid_ids)} IDs retenus pour la recherche.")
-            return valid_ids
+        valid_ids = doc_catalog_repository.get_filtered_doc_ids(employee, tags, exclude_ids, exclude_categories)
+        logger.info(f"✅ [DocRepo] {len(valid_ids)} IDs retenus pour la recherche.")
+        return valid_ids
+
+    def _upsert_statement(self, rows: list[dict]):
+        stmt = sqlite_insert(DocModel).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DocModel.employee, DocModel.doc],
+            set_={col: stmt.excluded[col] for col in self.UPSERT_UPDATE_COLUMNS}
+        )
+        return stmt.returning(*DocModel.__table__.c)
+
+    @staticmethod
+    def _upsert_values(data: DocCreate) -> dict:
+        values = data.model_dump()
+        values["doc_key"] = make_doc_key(data.doc)
+        values["date_update"] = datetime.now()
+        return values
 
     def upsert_doc(self, data: DocCreate) -> DocResponse:
+        """
+        INSERT ... ON CONFLICT (employee, doc) DO UPDATE ... RETURNING : une seule instruction,
+        atomique (deux ingestions concurrentes de la même URL ne créent pas de doublon).
+        """
         with self.get_session() as db:
-            existing = db.query(DocModel).filter(
-                DocModel.doc == data.doc,
-                DocModel.employee == data.employee
-            ).first()
+            row = db.execute(self._upsert_statement([self._upsert_values(data)])).one()
+            self._sync_tags(db, data.employee, data.doc, data.tags)
+            response = DocResponse.model_validate(row)
 
-            doc_to_return = None
-
-            if existing:
-                existing.category = data.category
-                existing.tags = data.tags
-                existing.synthesis = data.synthesis
-                existing.suggested_tags = data.suggested_tags
-                existing.quality = data.quality
-                existing.page_content = data.page_content
-                existing.status = data.status
-                existing.date_update = datetime.now()
-                
-                db.add(existing)
-                db.commit()
-                db.refresh(existing)
-                doc_to_return = existing
-            else:
-                new_doc = DocModel(**data.model_dump())
-                db.add(new_doc)
-                db.commit()
-                db.refresh(new_doc)
-                doc_to_return = new_doc
-             
-            return DocResponse.model_validate(doc_to_return)
+        # Les champs filtrables des chunks sont reportés par update_status en fin d'ingestion
+        doc_catalog_repository.upsert(data.employee, data.doc, data.status, data.category, data.tags)
+        return response
+
+    def upsert_docs(self, docs: list[DocCreate]) -> list[DocResponse]:
+        """
+        Upsert en masse : une instruction multi-valeurs par lot, une seule transaction.
+        Les réponses suivent l'ordre des docs dédoublonnés (SQLite ne garantit pas l'ordre de RETURNING).
+        """
+        # Un même (employee, doc) ne peut apparaître qu'une fois par instruction : le dernier gagne
+        unique_docs = list({(d.employee, d.doc): d for d in docs}.values())
+        responses = []
+
+        with self.get_session() as db:
+            for start in range(0, len(unique_docs), self.UPSERT_BATCH_SIZE):
+                batch = unique_docs[start:start + self.UPSERT_BATCH_SIZE]
+                rows = db.execute(self._upsert_statement([self._upsert_values(d) for d in batch])).all()
+                by_key = {(row.employee, row.doc): row for row in rows}
+                responses.extend(DocResponse.model_validate(by_key[(d.employee, d.doc)]) for d in batch)
+                for d in batch:
+                    self._sync_tags(db, d.employee, d.doc, d.tags)
+
+        for d in unique_docs:
+            doc_catalog_repository.upsert(d.employee, d.doc, d.status, d.category, d.tags)
+        logger.info(f"✅ [DocRepo] {len(unique_docs)} docs upsertés en lot.")
+        return responses
 
     def update_status(self, doc_id: str, employee: str, status: str):
         with self.get_session() as db:
@@ -111,55 +160,43 @@ class DocRepository(BaseRepository):
                 doc.status = status
                 doc.date_update = datetime.now()
                 db.commit()
+                doc_catalog_repository.update_status(employee, doc_id, status)
+                self._sync_chunk_filters(employee, doc_id)
 
     def delete_doc(self, doc_id: str, employee: str) -> dict:
         from repositories.chunk import chunk_repository 
 
         with self.get_session() as db:
             doc = db.query(DocModel).filter(
-                DocModel.doc == doc_id,
-                DocModel.employee == employee
-            ).first()
-
-            if not doc:
-                alt_id = doc_id[:-1] if doc_id.endswith("/") else doc_id + "/"
-                doc = db.query(DocModel).filter(
-                    DocModel.doc == alt_id,
-                    DocModel.employee == employee
-                ).first()
+                DocModel.employee == employee,
+                DocModel.doc_key == make_doc_key(doc_id)
+            ).order_by((DocModel.doc == doc_id).desc()).first()
 
             if not doc:
                 return {"status": "success", "message": "No document found to delete."}
 
             chunk_repository.delete_chunks_by_doc(doc.doc, employee)
             
+            self._sync_tags(db, employee, doc.doc, [])
             db.delete(doc)
             db.commit()
+            doc_catalog_repository.remove(employee, doc.doc)
             
             return {"status": "success", "message": f"{doc_id} SUCCESS_DELETE"}
 
     def get_unique_tags(self, employee: str) -> list[str]:
         with self.get_session() as db:
-            results = db.query(DocModel.tags).filter(DocModel.employee == employee).all()
-            unique_tags = set()
-            for (tag_list,) in results:
-                if tag_list and isinstance(tag_list, list):
-                    unique_tags.update(tag_list)
-            return sorted(list(unique_tags))
+            results = db.query(DocTagModel.tag).filter(DocTagModel.employee == employee).distinct().all()
+            return sorted(tag for (tag,) in results)
 
     def get_tags_with_count(self, employee: str) -> list[dict]:
         with self.get_session() as db:
-            results = db.query(DocModel.tags).filter(DocModel.employee == employee).all()
-            all_tags = []
-            for (tag_list,) in results:
-                if tag_list and isinstance(tag_list, list):
-                    all_tags.extend(tag_list)
-            
-            counter = Counter(all_tags)
-            response = [{"tag": tag, "count": count} for tag, count in counter.items()]
-            response.sort(key=lambda x: (-x["count"], x["tag"]))
-            
-            return response
+            count = func.count(DocTagModel.id)
+            results = db.query(DocTagModel.tag, count).filter(
+                DocTagModel.employee == employee
+            ).group_by(DocTagModel.tag).order_by(count.desc(), DocTagModel.tag).all()
+
+            return [{"tag": tag, "count": n} for tag, n in results]
 
     def get_unique_categories(self, employee: str) -> list[dict]:
         with self.get_session() as db:
@@ -186,43 +223,51 @@ class DocRepository(BaseRepository):
         
     def get_docs_by_tag(self, employee: str, tag: str) -> list[dict]:
         with self.get_session() as db:
-            docs = db.query(DocModel).filter(
+            target_tag = normalize_tag(tag)
+
+            # Jointure sur l'index (employee, tag_norm, doc) au lieu d'un scan de tous les docs
+            tagged_docs = db.query(DocTagModel.doc).filter(
+                DocTagModel.employee == employee,
+                DocTagModel.tag_norm == target_tag
+            )
+
+            # Projection : seules les sous-clés utiles de page_content sont extraites côté SQLite,
+            # le JSON complet du document n'est jamais désérialisé.
+            rows = db.query(
+                DocModel.doc, DocModel.source, DocModel.category, DocModel.name, DocModel.tags,
+                DocModel.status, DocModel.quality, DocModel.synthesis, DocModel.suggested_tags,
+                DocModel.origin, DocModel.date_init, DocModel.date_update,
+                DocModel.modified_fields, DocModel.manual_comment,
+                func.json_extract(DocModel.page_content, "$.about").label("about"),
+                func.json_extract(DocModel.page_content, "$.current_company.name").label("current_company_name"),
+                func.json_extract(DocModel.page_content, "$.current_company.title").label("current_title"),
+            ).filter(
                 DocModel.employee == employee,
-                DocModel.status != "Failed"
+                DocModel.status != "Failed",
+                DocModel.doc.in_(tagged_docs)
             ).all()
 
-            results = []
-            target_tag = tag.strip().lower()
-
-            for doc in docs:
-                doc_tags = [t.lower() for t in (doc.tags or [])]
-                
-                if target_tag in doc_tags:
-                    pc = doc.page_content or {}
-                    current_company = pc.get("current_company", {})
-                    if not isinstance(current_company, dict): 
-                        current_company = {}
-
-                    summary = {
-                        "doc": doc.doc,
-                        "source": doc.source,
-                        "category": doc.category,
-                        "name": doc.name or "",
-                        "tags": doc.tags,
-                        "status": doc.status,
-                        "quality": doc.quality,
-                        "synthesis": doc.synthesis,
-                        "suggested_tags": doc.suggested_tags,
-                        "origin": doc.origin,
-                        "date_init": doc.date_init,
-                        "date_update": doc.date_update,
-                        "about": pc.get("about", ""),
-                        "current_company_name": current_company.get("name", ""),
-                        "current_title": current_company.get("title", ""),
-                        "modified_fields": doc.modified_fields or "",
-                        "manual_comment": doc.manual_comment or ""
-                    }
-                    results.append(summary)
-            return results
+            return [
+                {
+                    "doc": row.doc,
+                    "source": row.source,
+                    "category": row.category,
+                    "name": row.name or "",
+                    "tags": row.tags,
+                    "status": row.status,
+                    "quality": row.quality,
+                    "synthesis": row.synthesis,
+                    "suggested_tags": row.suggested_tags,
+                    "origin": row.origin,
+                    "date_init": row.date_init,
+                    "date_update": row.date_update,
+                    "about": row.about or "",
+                    "current_company_name": row.current_company_name or "",
+                    "current_title": row.current_title or "",
+                    "modified_fields": row.modified_fields or "",
+                    "manual_comment": row.manual_comment or ""
+                }
+                for row in rows
+            ]
         
 doc_repository = DocRepository()
\ No newline at end of file
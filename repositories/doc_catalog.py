@@ -0,0 +1,140 @@
+"""
+Catalogue des documents en mémoire du process.
+
+Limite : le catalogue est local au process. Il n'est tenu à jour que par les écritures
+passant par DocRepository dans ce même process. Avec plusieurs workers uvicorn, ou après
+une écriture directe en base (scripts/ comme migrate_doc_tags ou clean_data), les autres
+catalogues restent périmés jusqu'au redémarrage du process.
+"""
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from database.models.doc import DocModel
+from .base import BaseRepository
+
+logger = logging.getLogger(__name__)
+
+def normalize_tag(tag) -> str:
+    return str(tag).lower().strip()
+
+class CatalogEntry:
+    """Fiche compacte d'un document (pas de page_content)."""
+    __slots__ = ("doc", "status", "category", "tags")
+
+    def __init__(self, doc: str, status: str, category: str, tags: frozenset):
+        self.doc = doc
+        self.status = status
+        self.category = category
+        self.tags = tags
+
+class EmployeeCatalog:
+    """Catalogue d'un employee : fiches + index inversé tag -> docs + ensemble des docs 'Done'."""
+    __slots__ = ("entries", "docs_by_tag", "done")
+
+    def __init__(self):
+        self.entries: Dict[str, CatalogEntry] = {}
+        self.docs_by_tag: Dict[str, Set[str]] = {}
+        self.done: Set[str] = set()
+
+    def put(self, entry: CatalogEntry):
+        self.remove(entry.doc)
+        self.entries[entry.doc] = entry
+        for tag in entry.tags:
+            self.docs_by_tag.setdefault(tag, set()).add(entry.doc)
+        if entry.status == "Done":
+            self.done.add(entry.doc)
+
+    def remove(self, doc_id: str):
+        old = self.entries.pop(doc_id, None)
+        if old is None:
+            return
+        for tag in old.tags:
+            docs = self.docs_by_tag.get(tag)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self.docs_by_tag[tag]
+        self.done.discard(doc_id)
+
+class DocCatalogRepository(BaseRepository):
+    """
+    Catalogue mémoire par employee, construit paresseusement (projection SQL sans page_content)
+    puis tenu à jour par DocRepository (upsert_doc / update_status / delete_doc).
+    Les filtres tags/exclusions deviennent de simples opérations d'ensembles.
+    """
+
+    def __init__(self):
+        self._catalogs: Dict[str, EmployeeCatalog] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _entry(doc: str, status: str, category: str, tags: Optional[Iterable]) -> CatalogEntry:
+        tag_list = tags if isinstance(tags, list) else []
+        return CatalogEntry(doc, status, category, frozenset(normalize_tag(t) for t in tag_list))
+
+    def _get(self, employee: str) -> EmployeeCatalog:
+        with self._lock:
+            catalog = self._catalogs.get(employee)
+            if catalog is not None:
+                return catalog
+
+            catalog = EmployeeCatalog()
+            with self.get_session() as db:
+                rows = db.query(DocModel.doc, DocModel.status, DocModel.category, DocModel.tags).filter(
+                    DocModel.employee == employee
+                ).all()
+            for doc, status, category, tags in rows:
+                catalog.put(self._entry(doc, status, category, tags))
+
+            self._catalogs[employee] = catalog
+            logger.info(f"📇 [DocCatalog] Catalogue chargé pour '{employee}' ({len(rows)} docs).")
+            return catalog
+
+    def get_entry(self, employee: str, doc_id: str) -> Optional[CatalogEntry]:
+        with self._lock:
+            return self._get(employee).entries.get(doc_id)
+
+    def get_filtered_doc_ids(self, employee: str, tags: list[str] = None, exclude_ids: list[str] = None,
+                             exclude_categories: list[str] = None) -> list[str]:
+        """Docs 'Done' ayant au moins un des tags demandés (tous si aucun tag), hors exclusions."""
+        with self._lock:
+            catalog = self._get(employee)
+            target_tags = {normalize_tag(t) for t in tags} if tags else set()
+
+            if target_tags:
+                matching = set()
+                for tag in target_tags:
+                    matching |= catalog.docs_by_tag.get(tag, set())
+                valid = matching & catalog.done
+            else:
+                valid = set(catalog.done)
+
+            if exclude_ids:
+                valid -= set(exclude_ids)
+            if exclude_categories:
+                excluded = set(exclude_categories)
+                valid = {d for d in valid if catalog.entries[d].category not in excluded}
+            return sorted(valid)
+
+    def upsert(self, employee: str, doc_id: str, status: str, category: str, tags: Optional[Iterable]):
+        with self._lock:
+            catalog = self._catalogs.get(employee)
+            if catalog is not None:
+                catalog.put(self._entry(doc_id, status, category, tags))
+
+    def update_status(self, employee: str, doc_id: str, status: str):
+        with self._lock:
+            catalog = self._catalogs.get(employee)
+            if catalog is None or doc_id not in catalog.entries:
+                return
+            old = catalog.entries[doc_id]
+            catalog.put(CatalogEntry(old.doc, status, old.category, old.tags))
+
+    def remove(self, employee: str, doc_id: str):
+        with self._lock:
+            catalog = self._catalogs.get(employee)
+            if catalog is not None:
+                catalog.remove(doc_id)
+
+doc_catalog_repository = DocCatalogRepository()
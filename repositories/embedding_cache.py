@@ -0,0 +1,51 @@
+import os
+import logging
+from array import array
+from typing import List, Optional
+
+from database.connection import CACHE_DIR, EMBEDDING_MODEL_ID
+from utils.disk_cache import DiskLRUCache
+from utils.text_hash import content_hash
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCacheRepository:
+    """
+    Cache persistant des embeddings de chunks.
+    Clé = modèle d'embedding + hash du texte normalisé -> un changement de modèle invalide tout.
+    """
+
+    def __init__(self, model_id: str = EMBEDDING_MODEL_ID):
+        self.model_id = model_id
+        self.cache = DiskLRUCache(
+            path=os.path.join(CACHE_DIR, "embeddings.sqlite3"),
+            max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+        )
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_id}:{content_hash(text)}"
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Retourne un embedding par texte (None si absent du cache)."""
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        results = []
+        for key in keys:
+            raw = found.get(key)
+            if raw is None:
+                results.append(None)
+                continue
+            vector = array("f")
+            vector.frombytes(raw)
+            results.append(vector.tolist())
+        return results
+
+    def set_many(self, texts: List[str], embeddings: List[List[float]]):
+        items = {
+            self._key(text): array("f", embedding).tobytes()
+            for text, embedding in zip(texts, embeddings)
+        }
+        self.cache.set_many(items)
+
+embedding_cache_repository = EmbeddingCacheRepository()
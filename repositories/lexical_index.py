@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import logging
+from typing import List, Optional
+
+from database.connection import LEXICAL_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+# Tokens alphanumériques Unicode (noms, dates, codes produit...)
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+class LexicalIndexRepository:
+    """
+    Index inversé sur disque (SQLite FTS5, scoring BM25) du texte des chunks.
+    Maintenu en parallèle de Chroma par ChunkRepository, cloisonné par employee.
+
+    - table 'chunks'     : une ligne par chunk (id Chroma, employee, doc, texte, métadonnées JSON)
+    - table 'chunks_fts' : index FTS5 'external content' synchronisé par triggers
+    """
+
+    MAX_QUERY_TOKENS = 32
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    rowid INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    employee TEXT NOT NULL,
+                    doc TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunks_employee_doc ON chunks(employee, doc);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    content, content='chunks', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+
+                CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts(rowid, content) VALUES (new.rowid, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE OF content ON chunks BEGIN
+                    INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                    INSERT INTO chunks_fts(rowid, content) VALUES (new.rowid, new.content);
+                END;
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def add_chunks(self, employee: str, doc_id: str, ids: List[str], documents: List[str], metadatas: List[dict]):
+        if not ids:
+            return
+        with self._lock:
+            conn = self._connect()
+            # DELETE explicite (et non INSERT OR REPLACE) pour que le trigger FTS soit bien déclenché
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(cid,) for cid in ids])
+            conn.executemany(
+                "INSERT INTO chunks (chunk_id, employee, doc, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (cid, employee, doc_id, doc, json.dumps(meta, ensure_ascii=False))
+                    for cid, doc, meta in zip(ids, documents, metadatas)
+                ]
+            )
+            conn.commit()
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        if not ids:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                [(json.dumps(meta, ensure_ascii=False), cid) for cid, meta in zip(ids, metadatas)]
+            )
+            conn.commit()
+
+    def delete_ids(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(cid,) for cid in ids])
+            conn.commit()
+
+    def delete_doc(self, doc_id: str, employee: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM chunks WHERE employee = ? AND doc = ?", (employee, doc_id))
+            conn.commit()
+
+    def _build_match(self, query: str) -> str:
+        # Chaque token est quoté (pas d'injection de syntaxe FTS) et combiné en OR : BM25 fait le tri
+        tokens = [t for t in _TOKEN.findall(query.lower()) if len(t) > 1]
+        tokens = list(dict.fromkeys(tokens))[:self.MAX_QUERY_TOKENS]
+        return " OR ".join(f'"{t}"' for t in tokens)
+
+    def search(self, query: str, employee: str, limit: int = 20, doc_ids_filter: Optional[List[str]] = None,
+               tag_keys: Optional[List[str]] = None, exclude_categories: Optional[List[str]] = None) -> List[dict]:
+        """
+        Recherche BM25. Retourne [{id, document, metadata, score}] trié par pertinence (score élevé = meilleur).
+        Mêmes règles que la clause where Chroma : sans doc_ids_filter, les champs filtrables
+        (doc_status, tag:<tag>, category) sont lus dans les métadonnées JSON des chunks.
+        """
+        match = self._build_match(query)
+        if not match:
+            return []
+        if doc_ids_filter is not None and len(doc_ids_filter) == 0:
+            return []
+
+        sql = (
+            "SELECT c.chunk_id, c.content, c.metadata, bm25(chunks_fts) AS rank "
+            "FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ? AND c.employee = ?"
+        )
+        params: list = [match, employee]
+        if doc_ids_filter is not None:
+            # Un seul paramètre JSON plutôt que des milliers de placeholders
+            sql += " AND c.doc IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(doc_ids_filter))
+        else:
+            sql += " AND json_extract(c.metadata, '$.doc_status') = 'Done'"
+            if tag_keys:
+                # Au moins une clé tag:<tag> à true (json_each : pas de chemin JSON construit à la main)
+                sql += (
+                    " AND EXISTS (SELECT 1 FROM json_each(c.metadata) m"
+                    " WHERE m.key IN (SELECT value FROM json_each(?)) AND m.value = 1)"
+                )
+                params.append(json.dumps(tag_keys))
+        if exclude_categories:
+            sql += " AND COALESCE(json_extract(c.metadata, '$.category'), '') NOT IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(exclude_categories)))
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        try:
+            with self._lock:
+                rows = self._connect().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"❌ Erreur recherche lexicale : {e}")
+            return []
+
+        # bm25() de SQLite est négatif (plus petit = meilleur) : on inverse le signe
+        return [
+            {"id": cid, "document": content, "metadata": json.loads(meta), "score": -rank}
+            for cid, content, meta, rank in rows
+        ]
+
+lexical_index_repository = LexicalIndexRepository()
@@ -0,0 +1,72 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+from database.connection import CACHE_DIR
+from utils.disk_cache import DiskLRUCache
+from utils.text_hash import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Tâches dont les réponses sont mises en cache (le modèle tourne à temperature=0 : même entrée -> même sortie).
+# 'chat' n'en fait pas partie par défaut : un utilisateur qui repose sa question attend une nouvelle génération.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TASKS = {
+    t.strip() for t in os.getenv("LLM_CACHE_TASKS", "extraction,hyde,entities,router,rewrite,rerank").split(",") if t.strip()
+}
+
+class LLMResponseCacheRepository:
+    """
+    Cache disque exact-match des réponses LLM : clé = modèle + hash (prompt système, contexte, entrée).
+    LRU borné en nombre d'entrées, métriques hit/miss par tâche.
+    """
+
+    def __init__(self):
+        self.cache = DiskLRUCache(
+            path=os.path.join(CACHE_DIR, "llm_responses.sqlite3"),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+        )
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled(task: str) -> bool:
+        return LLM_CACHE_ENABLED and task in LLM_CACHE_TASKS
+
+    @staticmethod
+    def _key(model: str, system_prompt: str, context: str, user_input: str) -> str:
+        payload = json.dumps([system_prompt, context, user_input], ensure_ascii=False)
+        return f"{model}:{content_hash(payload)}"
+
+    def _count(self, task: str, field: str):
+        with self._lock:
+            metrics = self._metrics.setdefault(task, {"hits": 0, "misses": 0})
+            metrics[field] += 1
+
+    def get(self, task: str, model: str, system_prompt: str, context: str, user_input: str) -> Optional[str]:
+        try:
+            raw = self.cache.get(self._key(model, system_prompt, context, user_input))
+        except Exception as e:
+            logger.warning(f"⚠️ [LLMCache] Lecture impossible : {e}")
+            raw = None
+
+        self._count(task, "hits" if raw is not None else "misses")
+        return raw.decode("utf-8") if raw is not None else None
+
+    def set(self, model: str, system_prompt: str, context: str, user_input: str, response: str):
+        try:
+            self.cache.set(self._key(model, system_prompt, context, user_input), response.encode("utf-8"))
+        except Exception as e:
+            logger.warning(f"⚠️ [LLMCache] Ecriture impossible : {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            tasks = {
+                task: {**m, "hit_rate": round(m["hits"] / (m["hits"] + m["misses"]), 3) if m["hits"] + m["misses"] else 0.0}
+                for task, m in self._metrics.items()
+            }
+        return {"tasks": tasks, "storage": self.cache.stats()}
+
+llm_response_cache_repository = LLMResponseCacheRepository()
@@ -1,12 +1,132 @@
+import os
+import time
+import queue
+import threading
+import logging
+from datetime import datetime
+from sqlalchemy import insert
 from schemas.log import ApiLogCreate
 from database.models.log import ApiLogModel
 from .base import BaseRepository
+from .credits import credits_repository, month_key
+
+logger = logging.getLogger(__name__)
 
 class LogRepository(BaseRepository):
     def create_log(self, log_data: ApiLogCreate):
         with self.get_session() as db:
-            log = ApiLogModel(**log_data.model_dump())
+            log = ApiLogModel(**log_data.model_dump(), start_time=datetime.utcnow())
             db.add(log)
-            # Pas de return nécessaire pour du logging fire-and-forget
-            
-log_repository = LogRepository()
\ No newline at end of file
+            # Compteur mensuel mis à jour dans la même transaction que le log
+            credits_repository.increment_usage(
+                db, {(log.employee, month_key(log.start_time)): log.total_cost or 0.0}
+            )
+        credits_repository.invalidate(log_data.employee)
+        # Pas de return nécessaire pour du logging fire-and-forget
+
+    def create_logs(self, rows: list[dict]):
+        """Insertion groupée (executemany) + compteurs mensuels, en une seule transaction."""
+        if not rows:
+            return
+        costs: dict[tuple[str, str], float] = {}
+        for row in rows:
+            if row.get("total_cost") and row["total_cost"] > 0:
+                key = (row["employee"], month_key(row["start_time"]))
+                costs[key] = costs.get(key, 0.0) + row["total_cost"]
+
+        with self.get_session() as db:
+            db.execute(insert(ApiLogModel), rows)
+            credits_repository.increment_usage(db, costs)
+
+        for employee, _ in costs:
+            credits_repository.invalidate(employee)
+
+    def enqueue_log(self, log_data: ApiLogCreate) -> bool:
+        """Version non bloquante pour le chemin des requêtes (voir BufferedLogWriter)."""
+        return log_writer.enqueue(log_data)
+
+class BufferedLogWriter:
+    """
+    Puits de logs asynchrone : file mémoire bornée vidée par un unique thread écrivain,
+    qui insère par lots (toutes les N lignes ou T ms). Si la file est pleine, l'entrée est
+    abandonnée et comptée plutôt que de ralentir la requête.
+    """
+
+    def __init__(self, repository: LogRepository):
+        self.repository = repository
+        self.batch_size = int(os.getenv("LOG_BATCH_SIZE", "200"))
+        self.flush_interval = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "500")) / 1000
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_MAX", "10000")))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        logger.info("📝 [LogWriter] Démarré.")
+
+    def stop(self, timeout: float = 10.0):
+        """Arrêt propre : le thread vide la file avant de sortir."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info(f"📝 [LogWriter] Arrêté. {self.stats()}")
+
+    def enqueue(self, log_data: ApiLogCreate) -> bool:
+        row = {**log_data.model_dump(), "start_time": datetime.utcnow()}
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"⚠️ [LogWriter] File pleine : {self.dropped} log(s) abandonné(s) au total.")
+            return False
+
+    def _drain(self, first: dict) -> list[dict]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = self._drain(first)
+            try:
+                self.repository.create_logs(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"❌ [LogWriter] Echec écriture de {len(batch)} log(s) : {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches
+        }
+
+log_repository = LogRepository()
+log_writer = BufferedLogWriter(log_repository)
@@ -1,4 +1,7 @@
+import os
+import time
 import logging
+import threading
 from sqlalchemy.orm import Session
 from database.models.prompt import PromptModel
 from schemas.prompt import PromptCreate, PromptResponse
@@ -8,14 +11,54 @@ from .base import BaseRepository
 logger = logging.getLogger(__name__)
 
 class PromptRepository(BaseRepository):
-    
+
+    def __init__(self):
+        # Cache process : nom -> (prompt, expiration). None = absent en base, mis en cache avec un TTL
+        # pour qu'un prompt inséré hors API (scripts/seed_prompts.py) finisse par être vu.
+        self._cache: dict[str, tuple[PromptResponse | None, float | None]] = {}
+        self._lock = threading.Lock()
+        self.miss_ttl_seconds = float(os.getenv("PROMPT_CACHE_MISS_TTL_SECONDS", "60"))
+        # Compteur incrémenté à chaque invalidation (sert aussi à détecter une lecture concurrente périmée)
+        self.version = 0
+
     def get_by_name(self, name: str) -> PromptResponse | None:
-        """Utilisé en interne par le backend"""
+        """Utilisé en interne par le backend (servi depuis le cache après la première lecture)"""
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached is not None and (cached[1] is None or cached[1] > time.monotonic()):
+                return cached[0]
+            version = self.version
+
         with self.get_session() as db:
             prompt = db.query(PromptModel).filter(PromptModel.name == name).first()
-            if prompt:
-                return PromptResponse.model_validate(prompt)
-            return None
+            result = PromptResponse.model_validate(prompt) if prompt else None
+
+        with self._lock:
+            # Une invalidation pendant la lecture SQL : la valeur lue est peut-être périmée, on ne la cache pas
+            if self.version == version:
+                expires_at = None if result is not None else time.monotonic() + self.miss_ttl_seconds
+                self._cache[name] = (result, expires_at)
+        return result
+
+    def invalidate(self, name: str | None = None):
+        """Invalide un prompt (ou tout le cache si name est None) et incrémente la version."""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+            self.version += 1
+
+    def preload(self) -> int:
+        """Charge tous les prompts en une requête (appelé au démarrage de l'API)."""
+        with self.get_session() as db:
+            prompts = [PromptResponse.model_validate(p) for p in db.query(PromptModel).all()]
+
+        with self._lock:
+            for p in prompts:
+                self._cache[p.name] = (p, None)
+        logger.info(f"✅ [PromptRepo] {len(prompts)} prompt(s) préchargé(s) en cache.")
+        return len(prompts)
 
     def get_prompts_for_user(self, employee: str) -> list[PromptResponse]:
         """
@@ -54,13 +97,16 @@ class PromptRepository(BaseRepository):
                 db.add(existing)
                 db.commit()
                 db.refresh(existing)
-                return PromptResponse.model_validate(existing)
+                response = PromptResponse.model_validate(existing)
             else:
                 logger.info(f"   -> Création d'un nouveau prompt")
                 new_prompt = PromptModel(**data.model_dump())
                 db.add(new_prompt)
                 db.commit()
                 db.refresh(new_prompt)
-                return PromptResponse.model_validate(new_prompt)
+                response = PromptResponse.model_validate(new_prompt)
+
+        self.invalidate(data.name)
+        return response
 
 prompt_repository = PromptRepository()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.text_hash import content_hash, normalize_text
+
+logger = logging.getLogger(__name__)
+
+class RerankCacheRepository:
+    """
+    Cache mémoire des scores de reranking (LRU + TTL).
+    Clé = (hash question normalisée, id chunk, hash contenu chunk, version du reranker).
+    Invalidé par doc quand ChunkRepository ajoute/supprime des chunks.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "50000"))
+        self.ttl_seconds = float(os.getenv("RERANK_CACHE_TTL_SECONDS", "86400"))
+        # clé -> (score, timestamp, (employee, doc))
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Tuple[float, float, Tuple[str, str]]]" = OrderedDict()
+        # (employee, doc) -> clés concernées, pour l'invalidation
+        self._keys_by_doc: Dict[Tuple[str, str], Set[Tuple[str, str, str, str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _question_hash(question: str) -> str:
+        return content_hash(normalize_text(question).lower())
+
+    @staticmethod
+    def _chunk_key(chunk: dict) -> Tuple[str, str]:
+        meta = chunk.get("metadata") or {}
+        return chunk.get("id", ""), meta.get("content_hash") or content_hash(chunk.get("content", ""))
+
+    @staticmethod
+    def _doc_key(chunk: dict) -> Tuple[str, str]:
+        meta = chunk.get("metadata") or {}
+        return meta.get("employee", ""), meta.get("doc", "")
+
+    def _unindex(self, key: Tuple[str, str, str, str], doc_key: Tuple[str, str]):
+        """Retire une clé de l'index par doc (appelé sous verrou) ; supprime les ensembles vides."""
+        keys = self._keys_by_doc.get(doc_key)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_doc[doc_key]
+
+    def get_many(self, question: str, version: str, chunks: List[dict]) -> List[Optional[float]]:
+        q_hash = self._question_hash(question)
+        now = time.time()
+        results: List[Optional[float]] = []
+
+        with self._lock:
+            for chunk in chunks:
+                key = (q_hash, *self._chunk_key(chunk), version)
+                entry = self._entries.get(key)
+                if entry is None or now - entry[1] > self.ttl_seconds:
+                    if entry is not None:
+                        del self._entries[key]
+                        self._unindex(key, entry[2])
+                    results.append(None)
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                results.append(entry[0])
+                self.hits += 1
+        return results
+
+    def set_many(self, question: str, version: str, chunks: List[dict], scores: List[Optional[float]]):
+        q_hash = self._question_hash(question)
+        now = time.time()
+
+        with self._lock:
+            for chunk, score in zip(chunks, scores):
+                if score is None:
+                    continue
+                key = (q_hash, *self._chunk_key(chunk), version)
+                doc_key = self._doc_key(chunk)
+                previous = self._entries.get(key)
+                if previous is not None and previous[2] != doc_key:
+                    self._unindex(key, previous[2])
+                self._entries[key] = (score, now, doc_key)
+                self._entries.move_to_end(key)
+                self._keys_by_doc.setdefault(doc_key, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._unindex(evicted_key, evicted[2])
+
+    def invalidate_doc(self, doc_id: str, employee: str):
+        with self._lock:
+            keys = self._keys_by_doc.pop((employee, doc_id), set())
+            for key in keys:
+                self._entries.pop(key, None)
+        if keys:
+            logger.info(f"🧹 [RerankCache] {len(keys)} scores invalidés pour {doc_id}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+rerank_cache_repository = RerankCacheRepository()
@@ -0,0 +1,38 @@
+import os
+import logging
+from typing import Optional
+
+from database.connection import CACHE_DIR
+from utils.disk_cache import DiskLRUCache
+from utils.text_hash import content_hash, normalize_text
+
+logger = logging.getLogger(__name__)
+
+class RewriteCacheRepository:
+    """
+    Cache persistant des réécritures de requêtes (requête normalisée -> mots-clés).
+    La clé inclut le modèle et le hash du prompt de réécriture : changer l'un invalide le cache.
+    """
+
+    def __init__(self):
+        self.cache = DiskLRUCache(
+            path=os.path.join(CACHE_DIR, "query_rewrites.sqlite3"),
+            max_entries=int(os.getenv("REWRITE_CACHE_MAX_ENTRIES", "20000"))
+        )
+
+    @staticmethod
+    def _key(query: str, model: str, system_prompt: str) -> str:
+        normalized = normalize_text(query).lower()
+        return f"{model}:{content_hash(system_prompt)[:12]}:{content_hash(normalized)}"
+
+    def get(self, query: str, model: str, system_prompt: str) -> Optional[str]:
+        raw = self.cache.get(self._key(query, model, system_prompt))
+        return raw.decode("utf-8") if raw is not None else None
+
+    def set(self, query: str, model: str, system_prompt: str, keywords: str):
+        self.cache.set(self._key(query, model, system_prompt), keywords.encode("utf-8"))
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+rewrite_cache_repository = RewriteCacheRepository()
@@ -0,0 +1,27 @@
+from typing import List, Tuple
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.models.router_decision import RouterDecisionModel
+from utils.text_hash import content_hash, normalize_text
+from .base import BaseRepository
+
+def query_hash(query: str) -> str:
+    """Hash de la requête normalisée (espaces, casse) : clé de dédoublonnage des décisions."""
+    return content_hash(normalize_text(query).lower())
+
+class RouterDecisionRepository(BaseRepository):
+    """Journal des décisions du routeur LLM (sert à entraîner le routeur local)."""
+
+    def add_decision(self, query: str, decision: str, embedding: List[float], source: str = "llm") -> bool:
+        """Enregistre la décision si la question n'a pas déjà été apprise. Retourne True si ajoutée."""
+        stmt = sqlite_insert(RouterDecisionModel).values(
+            query=query, query_hash=query_hash(query), decision=decision, embedding=embedding, source=source
+        ).on_conflict_do_nothing(index_elements=[RouterDecisionModel.query_hash])
+        with self.get_session() as db:
+            return db.execute(stmt).rowcount > 0
+
+    def get_training_set(self) -> List[Tuple[str, List[float]]]:
+        with self.get_session() as db:
+            rows = db.query(RouterDecisionModel.decision, RouterDecisionModel.embedding).all()
+            return [(decision, embedding) for decision, embedding in rows]
+
+router_decision_repository = RouterDecisionRepository()
@@ -0,0 +1,21 @@
+import sys
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories.doc import doc_repository
+
+def backfill_chunk_filters():
+    """
+    Ajoute aux chunks déjà indexés les champs filtrables (doc_status, category, tag:<tag>)
+    utilisés par la clause where Chroma. Idempotent : à relancer sans risque.
+    Exécuté automatiquement une fois par run_migrations quand CHROMA_FILTER_PUSHDOWN est actif.
+    """
+    print("🚀 Backfill des filtres de métadonnées Chroma...")
+    total = doc_repository.sync_all_chunk_filters()
+    print(f"✅ {total} chunks mis à jour.")
+
+if __name__ == "__main__":
+    backfill_chunk_filters()
@@ -0,0 +1,100 @@
+import sys
+import os
+import time
+import random
+import tempfile
+import threading
+import subprocess
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Paramètres du scénario
+DURATION_S = float(os.getenv("BENCH_DURATION_S", "10"))
+READERS = int(os.getenv("BENCH_READERS", "8"))
+DOCS_PER_WRITE = 20
+PAGE_CONTENT_CHARS = 200_000 # ~ un gros PDF
+
+def run_scenario():
+    """
+    Un écrivain (simule _process_file_background : upserts de gros documents en continu)
+    + N lecteurs (simule les routes de chat : tags, filtres, lecture d'un doc).
+    Mesure la latence des lectures et les erreurs "database is locked".
+    """
+    from database.connection import engine, SQLITE_PROFILE
+    from database.models import Base
+    from repositories.doc import doc_repository
+    from schemas.doc import DocCreate
+
+    Base.metadata.create_all(bind=engine)
+    employee = "bench_user"
+
+    def make_doc(i: int) -> DocCreate:
+        return DocCreate(
+            doc=f"doc_{i}", category="document", source="bench", origin="bench",
+            tags=[f"tag_{i % 10}"], status="Done", employee=employee, job_id="bench",
+            page_content={"text": "x" * PAGE_CONTENT_CHARS}
+        )
+
+    doc_repository.upsert_docs([make_doc(i) for i in range(100)])
+
+    stop = threading.Event()
+    latencies, errors, writes = [], [], [0]
+    lock = threading.Lock()
+
+    def writer():
+        i = 100
+        while not stop.is_set():
+            try:
+                doc_repository.upsert_docs([make_doc(i + k) for k in range(DOCS_PER_WRITE)])
+                writes[0] += DOCS_PER_WRITE
+            except Exception as e:
+                with lock:
+                    errors.append(f"write: {e}")
+            i += DOCS_PER_WRITE
+
+    def reader():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                doc_repository.get_tags_with_count(employee)
+                doc_repository.get_docs_by_tag(employee, f"tag_{random.randint(0, 9)}")
+                doc_repository.get_doc(f"doc_{random.randint(0, 99)}", employee)
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    latencies.append(elapsed)
+            except Exception as e:
+                with lock:
+                    errors.append(f"read: {e}")
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(READERS)]
+    for t in threads:
+        t.start()
+    time.sleep(DURATION_S)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+    locked = sum("locked" in e for e in errors)
+    print(
+        f"[{SQLITE_PROFILE:<11}] lectures={len(latencies):>6} | p50={p(0.5):7.1f}ms p95={p(0.95):7.1f}ms "
+        f"max={p(1.0):7.1f}ms | docs écrits={writes[0]:>5} | erreurs={len(errors)} (locked={locked})"
+    )
+    if latencies:
+        print(f"              moyenne={statistics.mean(latencies) * 1000:.1f}ms")
+
+def main():
+    """Lance le même scénario avec le profil SQLite par défaut puis le profil 'performance'."""
+    print(f"🚀 Benchmark concurrence SQLite ({READERS} lecteurs + 1 écrivain, {DURATION_S:.0f}s par profil)\n")
+    for profile in ("default", "performance"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SQLITE_PROFILE=profile, SQLITE_DB_PATH=os.path.join(tmp, "bench.db"))
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--run"], env=env, check=False)
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        run_scenario()
+    else:
+        main()
@@ -0,0 +1,35 @@
+import sys
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories.chunk import chunk_repository
+from repositories.lexical_index import lexical_index_repository
+
+BATCH_SIZE = 500
+
+def build_lexical_index():
+    """
+    (Re)construit l'index lexical BM25 à partir des chunks déjà présents dans Chroma.
+    À lancer une fois après la mise en place du mode hybride (les nouveaux chunks sont indexés à l'ingestion).
+    """
+    # Toutes les collections : partagée + shards par tenant (CHROMA_SHARDING)
+    for name in chunk_repository.list_collection_names():
+        collection = chunk_repository.client.get_collection(name)
+        total = collection.count()
+        print(f"🚀 Indexation lexicale de {total} chunks ({name})...")
+
+        offset = 0
+        while offset < total:
+            batch = collection.get(limit=BATCH_SIZE, offset=offset, include=["documents", "metadatas"])
+            for cid, doc, meta in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                lexical_index_repository.add_chunks(meta.get("employee", ""), meta.get("doc", ""), [cid], [doc], [meta])
+            offset += BATCH_SIZE
+            print(f"   ... {min(offset, total)}/{total}")
+
+    print("✅ Index lexical reconstruit.")
+
+if __name__ == "__main__":
+    build_lexical_index()
@@ -0,0 +1,25 @@
+import sys
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import engine
+from database.models import Base
+from repositories.doc import doc_repository
+
+def migrate_doc_tags():
+    """
+    Crée la table doc_tags (si absente) et la remplit depuis la colonne JSON docs.tags.
+    Idempotent : la table est entièrement reconstruite à chaque exécution.
+    Exécuté automatiquement une fois au démarrage (run_migrations) ; utile ensuite pour reconstruire.
+    """
+    print("🚀 Migration doc_tags...")
+    Base.metadata.create_all(bind=engine)
+
+    count = doc_repository.backfill_doc_tags()
+    print(f"✅ Tags normalisés pour {count} documents.")
+
+if __name__ == "__main__":
+    migrate_doc_tags()
@@ -0,0 +1,24 @@
+import sys
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import engine
+from database.models import Base
+from database.migrations import run_migrations
+from repositories.credits import credits_repository
+
+def reconcile(month: str | None = None):
+    """
+    Recalcule la table credit_usage depuis api_logs pour un mois ('YYYY-MM', défaut : mois courant).
+    À lancer une fois pour le backfill, puis ponctuellement en cas de doute.
+    """
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    count = credits_repository.reconcile_usage(month)
+    print(f"✅ {count} compteur(s) recalculé(s).")
+
+if __name__ == "__main__":
+    reconcile(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,61 @@
+import sys
+import os
+import logging
+import argparse
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories.chunk import chunk_repository, BASE_COLLECTION, CHROMA_SHARDING
+
+BATCH_SIZE = 500
+
+def shard_chroma_collection(drop_source: bool = False):
+    """
+    Répartit la collection partagée 'rag_chunks' dans une collection par tenant.
+    Les embeddings existants sont recopiés tels quels (aucun recalcul).
+    Idempotent (upsert) : peut être relancé après une interruption.
+    """
+    if CHROMA_SHARDING == "none":
+        print("❌ CHROMA_SHARDING=none : définir CHROMA_SHARDING=employee (ou domain) avant de lancer la migration.")
+        return
+
+    source = chunk_repository.client.get_collection(BASE_COLLECTION)
+    total = source.count()
+    print(f"🚀 Sharding ({CHROMA_SHARDING}) de {total} chunks depuis '{BASE_COLLECTION}'...")
+
+    moved = 0
+    offset = 0
+    while offset < total:
+        batch = source.get(limit=BATCH_SIZE, offset=offset, include=["documents", "metadatas", "embeddings"])
+
+        # Regroupement par collection cible
+        groups = {}
+        for cid, doc, meta, emb in zip(batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"]):
+            employee = (meta or {}).get("employee", "")
+            group = groups.setdefault(employee, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+            group["ids"].append(cid)
+            group["documents"].append(doc)
+            group["metadatas"].append(meta)
+            group["embeddings"].append([float(x) for x in emb])
+
+        for employee, group in groups.items():
+            chunk_repository.get_collection(employee).upsert(**group)
+            moved += len(group["ids"])
+
+        offset += BATCH_SIZE
+        print(f"   ... {min(offset, total)}/{total}")
+
+    shards = [n for n in chunk_repository.list_collection_names() if n != BASE_COLLECTION]
+    print(f"✅ {moved} chunks répartis dans {len(shards)} collection(s).")
+
+    if drop_source:
+        chunk_repository.client.delete_collection(BASE_COLLECTION)
+        chunk_repository.reset_collections()
+        print(f"🗑️ Collection '{BASE_COLLECTION}' supprimée.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Répartit rag_chunks en une collection Chroma par tenant.")
+    parser.add_argument("--drop-source", action="store_true", help="Supprime la collection partagée après copie")
+    args = parser.parse_args()
+    shard_chroma_collection(drop_source=args.drop_source)
@@ -0,0 +1,96 @@
+import sys
+import os
+import time
+import asyncio
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.llm import LLMService
+
+class StubModelInfo:
+    """Remplace Ollama /api/show : réponses programmées, appels comptés (aucun accès réseau)."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.threads = []
+
+    def __call__(self, model_name: str) -> dict:
+        self.calls += 1
+        self.threads.append(threading.get_ident())
+        response = self.responses.pop(0) if self.responses else self.responses_exhausted()
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    @staticmethod
+    def responses_exhausted():
+        raise RuntimeError("appel /api/show inattendu")
+
+def model_info(context_length: int) -> dict:
+    return {"model_info": {"llama.context_length": context_length}}
+
+def check(label: str, condition: bool) -> bool:
+    print(f"{'✅' if condition else '❌'} {label}")
+    return condition
+
+def validate_success() -> bool:
+    print("\n--- 1. Succès : taille native lue une seule fois, num_ctx fixe ---")
+    stub = StubModelInfo([model_info(4096)])
+    service = LLMService(model_name="llama3.2", model_info_fetcher=stub, task_models={})
+
+    window = service.get_context_window()
+    service.get_context_window()
+    ok = check(f"fenêtre = min(natif 4096, plafond) -> {window}", window == min(4096, service._runtime("chat").max_num_ctx))
+    ok &= check(f"un seul appel /api/show ({stub.calls})", stub.calls == 1)
+    ok &= check("même num_ctx pour toutes les tâches du modèle",
+                service._runtime("router").num_ctx == service._runtime("chat").num_ctx)
+    return ok
+
+def validate_fallback_and_retry() -> bool:
+    print("\n--- 2. Repli puis nouvel essai après le délai ---")
+    stub = StubModelInfo([RuntimeError("Ollama injoignable"), model_info(2048)])
+    service = LLMService(model_name="llama3.2", model_info_fetcher=stub, task_models={})
+    runtime = service._runtime("chat")
+    runtime.retry_seconds = 0.2
+
+    window = service.get_context_window()
+    ok = check(f"échec -> plafond LLM_MAX_NUM_CTX ({window})", window == runtime.max_num_ctx)
+
+    service.get_context_window()
+    ok &= check(f"pas de nouvel appel pendant le délai ({stub.calls})", stub.calls == 1)
+
+    time.sleep(runtime.retry_seconds + 0.05)
+    window = service.get_context_window()
+    ok &= check(f"après le délai : nouvel appel, taille native retenue ({window})", stub.calls == 2 and window == 2048)
+
+    service.get_context_window()
+    ok &= check(f"succès mis en cache ({stub.calls} appels)", stub.calls == 2)
+    return ok
+
+def validate_async_lookup() -> bool:
+    print("\n--- 3. Chemin async : /api/show hors de la boucle d'événements ---")
+    stub = StubModelInfo([model_info(4096)])
+    service = LLMService(model_name="llama3.2", model_info_fetcher=stub, task_models={})
+
+    async def resolve():
+        await service.aresolve_context_window("chat")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(resolve())
+    ok = check("lecture faite dans un thread", stub.calls == 1 and stub.threads[0] != loop_thread)
+    asyncio.run(service.aresolve_context_window("chat"))
+    ok &= check(f"fenêtre déjà résolue : aucun nouvel appel ({stub.calls})", stub.calls == 1)
+    return ok
+
+if __name__ == "__main__":
+    print("🚀 Validation : fenêtre de contexte Ollama (/api/show simulé)")
+    results = [validate_success(), validate_fallback_and_retry(), validate_async_lookup()]
+    if all(results):
+        print("\n✅ SUCCÈS : toutes les vérifications passent.")
+    else:
+        print("\n❌ ÉCHEC : voir les vérifications ci-dessus.")
+        sys.exit(1)
@@ -1,16 +1,25 @@
+import os
+import asyncio
 import logging
-import json
-import math
 from typing import List, Dict, Any
 from enum import Enum  # <--- Nouvel import
 
-from repositories.chunk import chunk_repository
-from repositories.prompt import prompt_repository
+from repositories.chunk import chunk_repository, CHROMA_FILTER_PUSHDOWN
+from repositories.rerank_cache import rerank_cache_repository
+from repositories.rewrite_cache import rewrite_cache_repository
 from services.llm import llm_service
-from utils.json_parser import robust_json_parse
+from services.reranking.manager import reranker_manager
+from services.router import strategy_router
+from utils.rank_fusion import reciprocal_rank_fusion
 
 logger = logging.getLogger(__name__)
 
+# 'vector' : Chroma seul | 'hybrid' : fusion RRF vecteur + BM25 (index lexical)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").lower()
+
+# 'llm' : routeur LLM systématique | 'local' : classifieur sur embeddings, LLM si confiance faible
+ROUTER_MODE = os.getenv("ROUTER_MODE", "local").lower()
+
 # --- 1. Définition des Stratégies (En haut du fichier) ---
 class SearchStrategy(Enum):
     GLOBAL = "global_summary"   # Pour comprendre un document entier
@@ -22,35 +31,85 @@ class AgentToolExecutor:
         self.employee = employee
 
     # --- 2. Le Cerveau (Nouvelle Méthode) ---
-    def _detect_strategy(self, query: str) -> SearchStrategy:
+    ROUTER_SYSTEM_PROMPT = (
+        "Tu es un routeur de recherche. Classifie la demande utilisateur.\n"
+        "CHOIX POSSIBLES :\n"
+        "1. 'GLOBAL' : Pour des résumés, analyses de fond, compréhension générale, 'de quoi ça parle'.\n"
+        "2. 'SPECIFIC' : Pour une question précise, un fait, une date, un nom, un chiffre, une définition technique.\n"
+        "Réponds UNIQUEMENT par le mot 'GLOBAL' ou 'SPECIFIC'."
+    )
+
+    def _detect_strategy_locally(self, query: str):
         """
-        Détermine si l'utilisateur veut un résumé global ou un fait précis.
+        Décision sans LLM (mots-clés, puis routeur local sur embeddings).
+        Retourne (stratégie ou None, vecteur de la requête ou None).
         """
         # Mots-clés qui forcent le mode GLOBAL (pas besoin de payer un appel LLM)
         keywords_global = ["résumé", "synthèse", "analyse", "global", "pass", "aperçu", "about", "sujet", "thème", "topo", "c'est quoi"]
         if any(k in query.lower() for k in keywords_global):
-            return SearchStrategy.GLOBAL
+            return SearchStrategy.GLOBAL, None
+
+        # Routeur local (embeddings) : évite l'appel LLM quand le classifieur est confiant
+        query_vector = None
+        if ROUTER_MODE == "local":
+            try:
+                query_vector = strategy_router.embed(query)
+                label, margin = strategy_router.classify(query_vector)
+                if label:
+                    logger.info(f"🧭 [Router] Décision locale : {label} (marge {margin:.3f})")
+                    return SearchStrategy[label], query_vector
+            except Exception as e:
+                logger.warning(f"⚠️ Erreur Router local : {e}. Passage au LLM.")
+
+        return None, query_vector
+
+    def _strategy_from_decision(self, query: str, query_vector, decision: str, from_cache: bool = False) -> SearchStrategy:
+        decision = decision.strip().upper()
+        label = "GLOBAL" if "GLOBAL" in decision else "SPECIFIC"
+
+        # Chaque décision LLM explicite (hors réponse rejouée depuis le cache) alimente le routeur local
+        if query_vector is not None and not from_cache and ("GLOBAL" in decision or "SPECIFIC" in decision):
+            try:
+                strategy_router.record(query, query_vector, label)
+            except Exception as e:
+                logger.warning(f"⚠️ Erreur enregistrement décision Router : {e}")
+
+        return SearchStrategy[label]
+
+    def _detect_strategy(self, query: str) -> SearchStrategy:
+        """
+        Détermine si l'utilisateur veut un résumé global ou un fait précis.
+        """
+        strategy, query_vector = self._detect_strategy_locally(query)
+        if strategy:
+            return strategy
 
         # Sinon, on demande au LLM (Routeur sémantique)
-        system_prompt = (
-            "Tu es un routeur de recherche. Classifie la demande utilisateur.\n"
-            "CHOIX POSSIBLES :\n"
-            "1. 'GLOBAL' : Pour des résumés, analyses de fond, compréhension générale, 'de quoi ça parle'.\n"
-            "2. 'SPECIFIC' : Pour une question précise, un fait, une date, un nom, un chiffre, une définition technique.\n"
-            "Réponds UNIQUEMENT par le mot 'GLOBAL' ou 'SPECIFIC'."
-        )
-        
         try:
             # Appel rapide au LLM
-            decision = llm_service.generate_response(
-                system_prompt=system_prompt, 
-                user_input=f"Requete: {query}"
-            ).strip().upper()
+            decision, from_cache = llm_service.generate_response_with_source(
+                system_prompt=self.ROUTER_SYSTEM_PROMPT,
+                user_input=f"Requete: {query}",
+                task="router"
+            )
+            return self._strategy_from_decision(query, query_vector, decision, from_cache)
             
-            if "GLOBAL" in decision: 
-                return SearchStrategy.GLOBAL
+        except Exception as e:
+            logger.warning(f"⚠️ Erreur Router : {e}. Fallback sur SPECIFIC.")
             return SearchStrategy.SPECIFIC
-            
+
+    async def _adetect_strategy(self, query: str) -> SearchStrategy:
+        strategy, query_vector = await asyncio.to_thread(self._detect_strategy_locally, query)
+        if strategy:
+            return strategy
+
+        try:
+            decision, from_cache = await llm_service.agenerate_response_with_source(
+                system_prompt=self.ROUTER_SYSTEM_PROMPT,
+                user_input=f"Requete: {query}",
+                task="router"
+            )
+            return await asyncio.to_thread(self._strategy_from_decision, query, query_vector, decision, from_cache)
         except Exception as e:
             logger.warning(f"⚠️ Erreur Router : {e}. Fallback sur SPECIFIC.")
             return SearchStrategy.SPECIFIC
@@ -77,7 +136,7 @@ class AgentToolExecutor:
             
             # 2. Reranking (Doux : On garde le Top 30)
             # On veut garder beaucoup de contexte pour que le ChatService puisse remplir
-            chunks = self.rerank_chunks(query, candidates, top_k=30)
+            chunks = self.rerank_chunks(query, candidates, top_k=30, strategy=strategy)
             
         else:
             # STRATÉGIE 2 : PRÉCISION (SPECIFIC)
@@ -89,123 +148,250 @@ class AgentToolExecutor:
             
             # 2. Reranking (Aggressif : On ne garde que le Top 7)
             # On élimine tout le bruit pour ne pas polluer la réponse
-            chunks = self.rerank_chunks(query, candidates, top_k=7)
+            # Si le lexical confirme les meilleurs candidats, on rerank un lot réduit
+            chunks = self.rerank_chunks(
+                query, candidates, top_k=7, max_candidates=self._rerank_pool_size(candidates), strategy=strategy
+            )
+
+        return {"chunks": chunks, "strategy": strategy}
+
+    async def asmart_retrieve(self, query: str, tags: List[str], exclude: dict) -> dict:
+        """
+        Version asynchrone de smart_retrieve (mêmes étapes) : les appels LLM sont attendus
+        sans bloquer la boucle, les accès Chroma / SQLite passent par un thread.
+        """
+        strategy = await self._adetect_strategy(query)
+        logger.info(f"🧠 [Router] Stratégie choisie : {strategy.value} pour '{query}'")
+
+        if strategy == SearchStrategy.GLOBAL:
+            candidates = await self.aexploratory_search(query, tags, exclude, limit=50)
+            chunks = await self.arerank_chunks(query, candidates, top_k=30, strategy=strategy)
+        else:
+            candidates = await self.aexploratory_search(query, tags, exclude, limit=30)
+            chunks = await self.arerank_chunks(
+                query, candidates, top_k=7, max_candidates=self._rerank_pool_size(candidates), strategy=strategy
+            )
 
         return {"chunks": chunks, "strategy": strategy}
 
     # --- 4. Les Outils de base (Vos méthodes existantes, légèrement adaptées) ---
 
+    REWRITE_SYSTEM_PROMPT = (
+        "Transforme cette demande en 3 à 5 mots-clés techniques de recherche."
+        "Réponds UNIQUEMENT par les mots-clés."
+    )
+    # En dessous, la requête est utilisée telle quelle (pas de réécriture LLM)
+    REWRITE_MIN_CHARS = 100
+
+    def _cached_rewrite(self, query: str) -> str | None:
+        """Requête finale si aucun appel LLM n'est nécessaire (requête courte ou déjà en cache)."""
+        if len(query) <= self.REWRITE_MIN_CHARS:
+            return query
+
+        cached = rewrite_cache_repository.get(query, llm_service.model_for("rewrite"), self.REWRITE_SYSTEM_PROMPT)
+        if cached:
+            stats = rewrite_cache_repository.stats()
+            logger.info(f"   ♻️ Requête réécrite (cache, hit rate {stats['hit_rate']:.0%}) : '{cached}'")
+            return cached
+
+        logger.info("   ✂️ Optimisation de la requête (Rewriting)...")
+        return None
+
+    def _store_rewrite(self, query: str, keywords: str) -> str:
+        search_query = keywords.strip().replace('"', '').replace('\n', ' ')
+        logger.info(f"   🤖 Requête réécrite : '{search_query}'")
+
+        if search_query:
+            rewrite_cache_repository.set(query, llm_service.model_for("rewrite"), self.REWRITE_SYSTEM_PROMPT, search_query)
+            return search_query
+        return query
+
+    def _rewrite_query(self, query: str) -> str:
+        """
+        Query Rewriting (uniquement si longue requête) avec cache persistant :
+        une même demande longue ne repaie jamais l'appel LLM.
+        """
+        cached = self._cached_rewrite(query)
+        if cached is not None:
+            return cached
+
+        try:
+            keywords = llm_service.generate_response(system_prompt=self.REWRITE_SYSTEM_PROMPT, user_input=f"Demande : {query}", task="rewrite")
+        except Exception:
+            return query
+        return self._store_rewrite(query, keywords)
+
+    async def _arewrite_query(self, query: str) -> str:
+        # Le cache de réécriture est un fichier SQLite : lectures/écritures hors de la boucle d'événements
+        if len(query) <= self.REWRITE_MIN_CHARS:
+            return query
+        cached = await asyncio.to_thread(self._cached_rewrite, query)
+        if cached is not None:
+            return cached
+
+        try:
+            keywords = await llm_service.agenerate_response(system_prompt=self.REWRITE_SYSTEM_PROMPT, user_input=f"Demande : {query}", task="rewrite")
+        except Exception:
+            return query
+        return await asyncio.to_thread(self._store_rewrite, query, keywords)
+
     def exploratory_search(self, query: str, tags: List[str], exclude: dict, limit: int = 50) -> List[dict]:
         """
         Récupère des candidats via recherche vectorielle.
         """
-        search_query = query
+        search_query = self._rewrite_query(query)
+        return self._search_candidates(query, search_query, tags, exclude, limit)
 
-        # Query Rewriting (uniquement si longue requête et pas déjà traitée)
-        if len(query) > 100:
-            logger.info("   ✂️ Optimisation de la requête (Rewriting)...")
-            system_prompt = (
-                "Transforme cette demande en 3 à 5 mots-clés techniques de recherche."
-                "Réponds UNIQUEMENT par les mots-clés."
-            )
-            try:
-                keywords = llm_service.generate_response(system_prompt=system_prompt, user_input=f"Demande : {query}")
-                search_query = keywords.strip().replace('"', '').replace('\n', ' ')
-                logger.info(f"   🤖 Requête réécrite : '{search_query}'")
-            except Exception:
-                pass
+    async def aexploratory_search(self, query: str, tags: List[str], exclude: dict, limit: int = 50) -> List[dict]:
+        search_query = await self._arewrite_query(query)
+        return await asyncio.to_thread(self._search_candidates, query, search_query, tags, exclude, limit)
 
-        # Recherche Vectorielle
+    def _search_candidates(self, query: str, search_query: str, tags: List[str], exclude: dict, limit: int) -> List[dict]:
+        """Recherche vectorielle (+ lexicale en mode hybride) et fusion des classements."""
+        # Recherche Vectorielle (multi-requêtes : question brute + version réécrite, en un seul appel)
         from repositories.doc import doc_repository
-        doc_ids = doc_repository.get_filtered_doc_ids(self.employee, tags)
-        
-        if not doc_ids:
-            return []
+        exclude_categories = exclude.get('categories') or []
 
-        results = chunk_repository.search(
-            query=search_query,
-            employee=self.employee,
-            limit=limit, # <--- Paramètre dynamique ici
-            doc_ids_filter=doc_ids
-        )
+        # Les ids de docs autorisés ne sont résolus que sans pushdown : sinon Chroma et l'index
+        # lexical filtrent eux-mêmes sur les métadonnées des chunks.
+        doc_ids = None
+        if not CHROMA_FILTER_PUSHDOWN:
+            doc_ids = doc_repository.get_filtered_doc_ids(self.employee, tags, exclude_categories=exclude_categories)
+            if not doc_ids:
+                return []
 
-        candidates = []
-        if results and results['documents']:
-            docs = results['documents'][0] if results['documents'] else []
-            ids = results['ids'][0] if results['ids'] else []
-            metas = results['metadatas'][0] if results['metadatas'] else []
-            dists = results['distances'][0] if 'distances' in results else [0.0]*len(ids)
-
-            for i, content in enumerate(docs):
-                meta = metas[i]
-                if exclude.get('sources') and meta.get('source') in exclude['sources']: continue
-                
-                dist = dists[i]
-                sim_score = 1 / (1 + dist) if dist is not None else 0.5
-
-                candidates.append({
-                    "content": content,
-                    "metadata": meta,
-                    "id": ids[i],
-                    "vector_score": sim_score 
+        queries = [query] if search_query == query else [query, search_query]
+        if CHROMA_FILTER_PUSHDOWN:
+            results = chunk_repository.search_many(
+                queries=queries,
+                employee=self.employee,
+                limit=limit,
+                tags=tags,
+                exclude_categories=exclude_categories
+            )
+        else:
+            results = chunk_repository.search_many(
+                queries=queries,
+                employee=self.employee,
+                limit=limit, # <--- Paramètre dynamique ici
+                doc_ids_filter=doc_ids,
+                exclude_categories=exclude_categories
+            )
+
+        fused = results["fused"]
+        lexical_ranks = {}
+
+        # Recherche Lexicale (BM25) : rattrape noms exacts, dates, codes produit
+        if SEARCH_MODE == "hybrid":
+            lexical_hits = chunk_repository.lexical_search(
+                " ".join(queries), self.employee, limit=limit, doc_ids_filter=doc_ids,
+                tags=tags, exclude_categories=exclude_categories
+            )
+            lexical_ranks = {hit["id"]: rank for rank, hit in enumerate(lexical_hits, start=1)}
+
+            by_id = {item["id"]: item for item in fused}
+            for hit in lexical_hits:
+                by_id.setdefault(hit["id"], {
+                    "id": hit["id"], "document": hit["document"], "metadata": hit["metadata"], "distance": None
                 })
+
+            rankings = [r["ids"] for r in results["queries"]] + [[hit["id"] for hit in lexical_hits]]
+            fused = [{**by_id[cid], "rrf_score": score} for cid, score in reciprocal_rank_fusion(rankings)]
+
+        candidates = []
+        for item in fused:
+            meta = item["metadata"]
+            if exclude.get('sources') and meta.get('source') in exclude['sources']: continue
+
+            dist = item["distance"]
+            sim_score = 1 / (1 + dist) if dist is not None else 0.5
+
+            candidates.append({
+                "content": item["document"],
+                "metadata": meta,
+                "id": item["id"],
+                "vector_score": sim_score,
+                "vector_hit": dist is not None,
+                "lexical_rank": lexical_ranks.get(item["id"]),
+                "rrf_score": item["rrf_score"]
+            })
         
-        return candidates
+        return candidates[:limit]
 
-    def rerank_chunks(self, question: str, chunks: List[dict], top_k: int = 10) -> List[dict]:
+    def _rerank_pool_size(self, candidates: List[dict], default: int = 20, reduced: int = 10) -> int:
+        """
+        Nombre de candidats envoyés au reranker.
+        Si au moins 2 des 5 premiers sont trouvés à la fois par le vectoriel et en tête du lexical,
+        le classement est déjà fiable : un lot réduit suffit (moins d'appels LLM).
         """
-        Reranking par lots (Batching).
+        strong_hits = [
+            c for c in candidates[:5]
+            if c.get("vector_hit") and c.get("lexical_rank") and c["lexical_rank"] <= 5
+        ]
+        return reduced if len(strong_hits) >= 2 else default
+
+    def rerank_chunks(self, question: str, chunks: List[dict], top_k: int = 10, max_candidates: int = 20,
+                      strategy: SearchStrategy = SearchStrategy.SPECIFIC) -> List[dict]:
+        """
+        Reranking via le backend configuré pour la stratégie (LLM, cross-encoder ou cosinus).
         Paramètre top_k ajouté pour contrôler la sévérité du filtrage.
+        max_candidates : taille du lot soumis au reranker.
         """
         if not chunks:
             return []
 
+        reranker, version, candidates, scores, uncached = self._prepare_rerank(question, chunks, max_candidates, strategy)
+        fresh = reranker.score(question, [candidates[i] for i in uncached]) if uncached else []
+        return self._finish_rerank(question, chunks, top_k, reranker, version, candidates, scores, uncached, fresh)
+
+    async def arerank_chunks(self, question: str, chunks: List[dict], top_k: int = 10, max_candidates: int = 20,
+                             strategy: SearchStrategy = SearchStrategy.SPECIFIC) -> List[dict]:
+        """Version asynchrone de rerank_chunks (backend LLM : lots concurrents sans thread)."""
+        if not chunks:
+            return []
+
+        # version() du reranker peut lire le prompt en base : préparation hors de la boucle d'événements
+        reranker, version, candidates, scores, uncached = await asyncio.to_thread(
+            self._prepare_rerank, question, chunks, max_candidates, strategy
+        )
+        fresh = await reranker.ascore(question, [candidates[i] for i in uncached]) if uncached else []
+        return self._finish_rerank(question, chunks, top_k, reranker, version, candidates, scores, uncached, fresh)
+
+    def _prepare_rerank(self, question: str, chunks: List[dict], max_candidates: int, strategy: SearchStrategy):
         # On ne rerank que les N premiers candidats vectoriels pour aller vite
         # (Si on a demandé 50 candidats vectoriels, on n'en rerank que 20 par exemple pour gagner du temps)
-        candidates_to_process = chunks[:20] 
-        
-        prompt_doc = prompt_repository.get_by_name("agent_rerank")
-        if not prompt_doc:
-            return candidates_to_process[:top_k]
+        candidates_to_process = chunks[:max_candidates] 
 
-        BATCH_SIZE = 5
-        scored_chunks = []
-        
-        num_batches = math.ceil(len(candidates_to_process) / BATCH_SIZE)
-        
-        logger.info(f"⚖️ [Tool] Reranking de {len(candidates_to_process)} chunks ({num_batches} batches)...")
+        reranker = reranker_manager.for_strategy(strategy.name)
+        logger.info(f"⚖️ [Tool] Reranking de {len(candidates_to_process)} chunks (backend: {reranker.name})...")
 
-        for i in range(num_batches):
-            start = i * BATCH_SIZE
-            end = start + BATCH_SIZE
-            batch = candidates_to_process[start:end]
-            
-            context_text = ""
-            for idx, c in enumerate(batch):
-                preview = c['content'][:800].replace("\n", " ") 
-                context_text += f"--- Chunk {idx} ---\n{preview}\n\n"
+        # Cache de scores : seuls les chunks jamais évalués pour cette question partent au reranker
+        version = reranker.version()
+        scores = rerank_cache_repository.get_many(question, version, candidates_to_process)
+        uncached = [i for i, s in enumerate(scores) if s is None]
+        return reranker, version, candidates_to_process, scores, uncached
 
-            final_prompt = prompt_doc.prompt.replace("{question}", question).replace("{context}", context_text)
+    def _finish_rerank(self, question: str, chunks: List[dict], top_k: int, reranker, version: str,
+                       candidates_to_process: List[dict], scores: list, uncached: List[int], fresh) -> List[dict]:
+        if uncached:
+            to_score = [candidates_to_process[i] for i in uncached]
+            if fresh is None:
+                if len(uncached) == len(candidates_to_process):
+                    return candidates_to_process[:top_k]
+                fresh = [None] * len(to_score)
+            rerank_cache_repository.set_many(question, version, to_score, fresh)
+            for i, value in zip(uncached, fresh):
+                scores[i] = value
 
-            try:
-                llm_response = llm_service.generate_response(
-                    system_prompt="Tu es un système de scoring JSON. Réponds UNIQUEMENT avec un tableau JSON strict.",
-                    user_input=final_prompt
-                )
-                scores_data = robust_json_parse(llm_response)
-                if isinstance(scores_data, dict): scores_data = [scores_data]
-                
-                if isinstance(scores_data, list):
-                    for item in scores_data:
-                        local_idx = item.get("chunk_index")
-                        score = item.get("score", 0.0)
-                        if local_idx is not None and isinstance(local_idx, int) and 0 <= local_idx < len(batch):
-                            real_chunk = batch[local_idx]
-                            real_chunk["score"] = score
-                            if score >= 0.4: # Seuil un peu plus bas pour ne pas trop jeter
-                                scored_chunks.append(real_chunk)
-            except Exception:
+        logger.info(f"⚖️ [Tool] {len(candidates_to_process) - len(uncached)}/{len(candidates_to_process)} scores servis par le cache.")
+
+        scored_chunks = []
+        for chunk, score in zip(candidates_to_process, scores):
+            if score is None:
                 continue
+            chunk["score"] = score
+            if score >= reranker.threshold: # Seuil propre à chaque reranker (échelle 0..1)
+                scored_chunks.append(chunk)
 
         # Tri final
         scored_chunks.sort(key=lambda x: x.get("score", 0), reverse=True)
@@ -216,4 +402,4 @@ class AgentToolExecutor:
         if not final_selection and chunks:
             return chunks[:3]
 
-        return final_selection
\ No newline at end of file
+        return final_selection
@@ -1,15 +1,21 @@
 import logging
-from typing import List, Tuple
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
 
 from repositories.prompt import prompt_repository
 from services.llm import llm_service
+from services.llm_scheduler import set_current_employee
 from schemas.chat import ChatRequestNode
+from utils.token_counter import count_tokens
 # Assurez-vous d'avoir bien ajouté SearchStrategy dans services/agent_tools.py comme vu précédemment
 from services.agent_tools import AgentToolExecutor, SearchStrategy 
 
 logger = logging.getLogger(__name__)
 
 class ChatService:
+
+    EXPERT_SYSTEM_PROMPT = "Tu es un expert qualifié."
+    STANDARD_SYSTEM_PROMPT = "Tu es un assistant utile et précis. Réponds en français en te basant sur le contexte fourni."
     
     def handle_node_chat(self, request: ChatRequestNode) -> dict:
         """
@@ -18,12 +24,9 @@ class ChatService:
         """
         logger.info(f"🚀 [CHAT] Demande reçue: Prompt='{request.prompt}' | Q='{request.question}'")
 
+        set_current_employee(request.employee)
         tools = AgentToolExecutor(request.employee)
-        
-        # Gestion des exclusions (Toujours exclure les archives par défaut)
-        exclude = request.exclude if isinstance(request.exclude, dict) else {}
-        if "archive" not in exclude.get("categories", []):
-            exclude.setdefault("categories", []).append("archive")
+        exclude = self._build_exclude(request)
 
         # Sélection du workflow
         if request.prompt:
@@ -31,7 +34,49 @@ class ChatService:
         
         return self._handle_standard_workflow(request, tools, exclude)
 
-    def _build_dynamic_context(self, ranked_chunks: List[dict], sort_by: str = "index", max_chunks: int = 0) -> Tuple[str, List[dict]]:
+    async def ahandle_node_chat(self, request: ChatRequestNode) -> dict:
+        """
+        Version asynchrone de handle_node_chat : la boucle d'événements reste libre
+        pendant les appels Ollama (plusieurs chats en parallèle par process).
+        """
+        logger.info(f"🚀 [CHAT] Demande reçue (async): Prompt='{request.prompt}' | Q='{request.question}'")
+
+        set_current_employee(request.employee)
+        tools = AgentToolExecutor(request.employee)
+        exclude = self._build_exclude(request)
+
+        if request.prompt:
+            return await self._ahandle_expert_workflow(request, tools, exclude)
+
+        return await self._ahandle_standard_workflow(request, tools, exclude)
+
+    @staticmethod
+    def _build_exclude(request: ChatRequestNode) -> dict:
+        # Gestion des exclusions (Toujours exclure les archives par défaut)
+        exclude = request.exclude if isinstance(request.exclude, dict) else {}
+        if "archive" not in exclude.get("categories", []):
+            exclude.setdefault("categories", []).append("archive")
+        return exclude
+
+    def _select_context(self, chunks: List[dict], strategy: SearchStrategy, token_budget: int) -> Tuple[str, List[dict]]:
+        if strategy == SearchStrategy.GLOBAL:
+            # Stratégie Résumé : On prend le max de chunks, triés par Index (lecture livre)
+            return self._build_dynamic_context(chunks, sort_by="index", token_budget=token_budget)
+        # Stratégie Précision : On prend max 5 chunks, triés par Score
+        return self._build_dynamic_context(chunks, sort_by="score", max_chunks=5, token_budget=token_budget)
+
+    @staticmethod
+    def _format_sources(final_selection: List[dict]) -> List[dict]:
+        # Formatage des sources pour le frontend
+        unique_sources = {c['metadata'].get('doc'): c for c in final_selection}.values()
+        return [{"name": c['metadata'].get('doc'), "score": c.get("score")} for c in unique_sources]
+
+    @staticmethod
+    def _format_chunk(chunk: dict) -> str:
+        return f"--- Source: {chunk['metadata'].get('doc')} (Index: {chunk['metadata'].get('chunk_index', '?')}, Score: {chunk.get('score', 0):.2f}) ---\n{chunk['content']}"
+
+    def _build_dynamic_context(self, ranked_chunks: List[dict], sort_by: str = "index", max_chunks: int = 0,
+                               token_budget: Optional[int] = None) -> Tuple[str, List[dict]]:
         """
         Construit la chaîne de contexte (String) à partir des chunks bruts.
         
@@ -39,12 +84,14 @@ class ChatService:
             ranked_chunks: Liste des chunks (déjà triés par score/pertinence par smart_retrieve).
             sort_by: 'index' (pour lecture narrative) ou 'score' (pour pertinence pure).
             max_chunks: Limite optionnelle en nombre de chunks (ex: 5 pour du fact-checking).
+            token_budget: Tokens disponibles pour le contexte (prompt, historique et réponse déjà déduits).
         """
         selected_chunks = []
-        current_chars = 0
+        current_tokens = 0
         
-        # 1. Récupération de la limite technique du modèle chargé
-        max_chars_limit = llm_service.get_context_limit()
+        # 1. Budget en tokens : fenêtre réelle du modèle moins prompt et réponse réservée
+        if token_budget is None:
+            token_budget = llm_service.get_context_token_budget()
         
         # 2. Application de la limite numérique (si demandée)
         candidates = ranked_chunks
@@ -53,16 +100,15 @@ class ChatService:
         
         # 3. Remplissage intelligent (Context Stuffing)
         # On prend les chunks dans l'ordre de pertinence (candidates est trié par score)
-        # tant qu'il y a de la place en mémoire.
+        # tant qu'il y a de la place dans la fenêtre (en-tête de source et séparateur compris).
         for chunk in candidates:
-            content_len = len(chunk['content'])
+            chunk_tokens = count_tokens(self._format_chunk(chunk)) + 1
             
-            # Vérification de l'espace disponible (avec marge de sécurité)
-            if current_chars + content_len < max_chars_limit:
+            if current_tokens + chunk_tokens <= token_budget:
                 selected_chunks.append(chunk)
-                current_chars += content_len
+                current_tokens += chunk_tokens
             else:
-                logger.info(f"🛑 Limite contexte atteinte ({current_chars}/{max_chars_limit} chars). Arrêt.")
+                logger.info(f"🛑 Limite contexte atteinte ({current_tokens}/{token_budget} tokens). Arrêt.")
                 break
         
         if not selected_chunks:
@@ -78,44 +124,16 @@ class ChatService:
             # Utile pour que le LLM voit la réponse la plus probable tout de suite.
             selected_chunks.sort(key=lambda x: x.get('score', 0), reverse=True)
 
-        logger.info(f"📚 Contexte final construit : {len(selected_chunks)} chunks (~{current_chars} chars) | Tri: {sort_by}")
+        logger.info(f"📚 Contexte final construit : {len(selected_chunks)} chunks (~{current_tokens} tokens) | Tri: {sort_by}")
 
         # 5. Assemblage de la string
-        context_str = "\n\n".join([
-            f"--- Source: {c['metadata'].get('doc')} (Index: {c['metadata'].get('chunk_index', '?')}, Score: {c.get('score', 0):.2f}) ---\n{c['content']}" 
-            for c in selected_chunks
-        ])
+        context_str = "\n\n".join([self._format_chunk(c) for c in selected_chunks])
         
         return context_str, selected_chunks
 
-    def _handle_expert_workflow(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
-        logger.info("🧠 [Workflow] Démarrage mode EXPERT")
-
-        # A. Chargement du Prompt Système
-        prompt_doc = prompt_repository.get_by_name(request.prompt)
-        if not prompt_doc:
-            return {"response": f"Erreur: Prompt '{request.prompt}' introuvable.", "sources": []}
-
-        target_input = request.question if request.question and request.question.strip() else "Analyse globale"
-        
-        # B. Récupération Intelligente (Router -> Search -> Rerank)
-        retrieval_result = tools.smart_retrieve(target_input, request.tags, exclude)
-        chunks = retrieval_result["chunks"]
-        strategy = retrieval_result["strategy"]
-
-        # C. Construction du Contexte Adaptative
-        context_str = ""
-        final_selection = []
-
-        if strategy == SearchStrategy.GLOBAL:
-            # Stratégie Résumé : On prend le max de chunks, triés par Index (lecture livre)
-            context_str, final_selection = self._build_dynamic_context(chunks, sort_by="index")
-        else:
-            # Stratégie Précision : On prend max 5 chunks, triés par Score
-            context_str, final_selection = self._build_dynamic_context(chunks, sort_by="score", max_chunks=5)
-
+    def _expert_prompt(self, request: ChatRequestNode, system_msg: str, strategy: SearchStrategy,
+                       context_str: str, has_context: bool, target_input: str) -> str:
         # D. Assemblage du Prompt Final
-        system_msg = prompt_doc.prompt
         user_msg_content = f"""
         Voici les données contextuelles récupérées (Mode: {strategy.value}) :
         
@@ -126,7 +144,7 @@ class ChatService:
         En utilisant ces données, exécute la tâche demandée.
         """
         
-        if not final_selection:
+        if not has_context:
             user_msg_content = f"Aucune donnée pertinente trouvée pour '{target_input}'. Fais de ton mieux avec tes connaissances générales."
 
         # Historique (si présent)
@@ -136,23 +154,85 @@ class ChatService:
                 [f"{m.get('role','').upper()}: {m.get('content','')}" for m in request.history]
             ) + "\n\n"
 
-        full_prompt = f"{system_msg}\n\n{history_block}USER TASK:\n{user_msg_content}"
+        return f"{system_msg}\n\n{history_block}USER TASK:\n{user_msg_content}"
+
+    def _expert_budget(self, request: ChatRequestNode, system_msg: str, strategy: SearchStrategy, target_input: str) -> int:
+        """Budget contexte du mode expert : tout ce qui entoure le contexte (prompt, historique) est déduit."""
+        framing = self._expert_prompt(request, system_msg, strategy, "", True, target_input)
+        return llm_service.get_context_token_budget(self.EXPERT_SYSTEM_PROMPT, framing)
+
+    def _handle_expert_workflow(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
+        logger.info("🧠 [Workflow] Démarrage mode EXPERT")
+
+        # A. Chargement du Prompt Système
+        prompt_doc = prompt_repository.get_by_name(request.prompt)
+        if not prompt_doc:
+            return {"response": f"Erreur: Prompt '{request.prompt}' introuvable.", "sources": []}
+
+        target_input = request.question if request.question and request.question.strip() else "Analyse globale"
+        
+        # B. Récupération Intelligente (Router -> Search -> Rerank)
+        retrieval_result = tools.smart_retrieve(target_input, request.tags, exclude)
+        chunks = retrieval_result["chunks"]
+        strategy = retrieval_result["strategy"]
+
+        # C. Construction du Contexte Adaptative
+        token_budget = self._expert_budget(request, prompt_doc.prompt, strategy, target_input)
+        context_str, final_selection = self._select_context(chunks, strategy, token_budget)
+        full_prompt = self._expert_prompt(request, prompt_doc.prompt, strategy, context_str, bool(final_selection), target_input)
         
         # E. Génération
         try:
             response = llm_service.generate_response(
-                system_prompt="Tu es un expert qualifié.",
-                user_input=full_prompt
+                system_prompt=self.EXPERT_SYSTEM_PROMPT,
+                user_input=full_prompt,
+                task="chat"
             )
         except Exception as e:
             logger.error(f"❌ Erreur génération : {e}")
             return {"response": "Désolé, une erreur technique est survenue lors de la génération.", "sources": []}
 
-        # Formatage des sources pour le frontend
-        unique_sources = {c['metadata'].get('doc'): c for c in final_selection}.values()
-        sources_list = [{"name": c['metadata'].get('doc'), "score": c.get("score")} for c in unique_sources]
+        return {"response": response, "sources": self._format_sources(final_selection)}
+
+    async def _aprepare_expert(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
+        """Récupération + assemblage du prompt expert (tout sauf la génération)."""
+        logger.info("🧠 [Workflow] Démarrage mode EXPERT (async)")
+
+        prompt_doc = await asyncio.to_thread(prompt_repository.get_by_name, request.prompt)
+        if not prompt_doc:
+            return {"error": f"Erreur: Prompt '{request.prompt}' introuvable."}
+
+        target_input = request.question if request.question and request.question.strip() else "Analyse globale"
+
+        retrieval_result = await tools.asmart_retrieve(target_input, request.tags, exclude)
+        strategy = retrieval_result["strategy"]
+
+        await llm_service.aresolve_context_window("chat")
+        token_budget = self._expert_budget(request, prompt_doc.prompt, strategy, target_input)
+        context_str, final_selection = self._select_context(retrieval_result["chunks"], strategy, token_budget)
+        return {
+            "system_prompt": self.EXPERT_SYSTEM_PROMPT,
+            "user_input": self._expert_prompt(request, prompt_doc.prompt, strategy, context_str, bool(final_selection), target_input),
+            "context": "",
+            "sources": self._format_sources(final_selection)
+        }
+
+    async def _ahandle_expert_workflow(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
+        prepared = await self._aprepare_expert(request, tools, exclude)
+        if "error" in prepared:
+            return {"response": prepared["error"], "sources": []}
+
+        try:
+            response = await llm_service.agenerate_response(
+                system_prompt=prepared["system_prompt"],
+                user_input=prepared["user_input"],
+                task="chat"
+            )
+        except Exception as e:
+            logger.error(f"❌ Erreur génération : {e}")
+            return {"response": "Désolé, une erreur technique est survenue lors de la génération.", "sources": []}
 
-        return {"response": response, "sources": sources_list}
+        return {"response": response, "sources": prepared["sources"]}
 
     def _handle_standard_workflow(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
         """
@@ -166,21 +246,80 @@ class ChatService:
         strategy = retrieval_result["strategy"]
         
         # B. Contexte Adaptatif
-        if strategy == SearchStrategy.GLOBAL:
-            context_str, final_selection = self._build_dynamic_context(chunks, sort_by="index")
-        else:
-            context_str, final_selection = self._build_dynamic_context(chunks, sort_by="score", max_chunks=5)
+        token_budget = llm_service.get_context_token_budget(self.STANDARD_SYSTEM_PROMPT, query)
+        context_str, final_selection = self._select_context(chunks, strategy, token_budget)
         
         # C. Génération
         answer = llm_service.generate_response(
-            system_prompt="Tu es un assistant utile et précis. Réponds en français en te basant sur le contexte fourni.",
+            system_prompt=self.STANDARD_SYSTEM_PROMPT,
             user_input=query,
-            context=context_str
+            context=context_str,
+            task="chat"
         )
         
-        unique_sources = {c['metadata'].get('doc'): c for c in final_selection}.values()
-        sources_list = [{"name": c['metadata'].get('doc'), "score": c.get("score")} for c in unique_sources]
-        
-        return {"response": answer, "sources": sources_list}
+        return {"response": answer, "sources": self._format_sources(final_selection)}
+
+    async def _aprepare_standard(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
+        query = request.question if request.question.strip() else "Résumé"
+
+        retrieval_result = await tools.asmart_retrieve(query, request.tags, exclude)
+        await llm_service.aresolve_context_window("chat")
+        token_budget = llm_service.get_context_token_budget(self.STANDARD_SYSTEM_PROMPT, query)
+        context_str, final_selection = self._select_context(retrieval_result["chunks"], retrieval_result["strategy"], token_budget)
+        return {
+            "system_prompt": self.STANDARD_SYSTEM_PROMPT,
+            "user_input": query,
+            "context": context_str,
+            "sources": self._format_sources(final_selection)
+        }
+
+    async def _ahandle_standard_workflow(self, request: ChatRequestNode, tools: AgentToolExecutor, exclude: dict) -> dict:
+        prepared = await self._aprepare_standard(request, tools, exclude)
+
+        answer = await llm_service.agenerate_response(
+            system_prompt=prepared["system_prompt"],
+            user_input=prepared["user_input"],
+            context=prepared["context"],
+            task="chat"
+        )
+
+        return {"response": answer, "sources": prepared["sources"]}
+
+    async def astream_node_chat(self, request: ChatRequestNode) -> AsyncIterator[dict]:
+        """
+        Chat en streaming. Événements émis, dans l'ordre :
+        - {"type": "sources", "sources": [...]}  dès la fin de la récupération
+        - {"type": "token", "content": "..."}    au fil de la génération
+        - {"type": "end", "response": "..."}     réponse complète (la route ajoute crédits et job_id)
+        """
+        logger.info(f"🚀 [CHAT] Demande reçue (stream): Prompt='{request.prompt}' | Q='{request.question}'")
+
+        set_current_employee(request.employee)
+        tools = AgentToolExecutor(request.employee)
+        exclude = self._build_exclude(request)
+
+        if request.prompt:
+            prepared = await self._aprepare_expert(request, tools, exclude)
+        else:
+            prepared = await self._aprepare_standard(request, tools, exclude)
+
+        if "error" in prepared:
+            yield {"type": "sources", "sources": []}
+            yield {"type": "token", "content": prepared["error"]}
+            yield {"type": "end", "response": prepared["error"]}
+            return
+
+        yield {"type": "sources", "sources": prepared["sources"]}
+
+        parts = []
+        async for fragment in llm_service.astream_response(
+            system_prompt=prepared["system_prompt"],
+            user_input=prepared["user_input"],
+            context=prepared["context"]
+        ):
+            parts.append(fragment)
+            yield {"type": "token", "content": fragment}
+
+        yield {"type": "end", "response": "".join(parts)}
 
 chat_service = ChatService()
\ No newline at end of file
@@ -25,6 +25,7 @@ class EnrichmentService:
         raw_response = llm_service.generate_response(
             system_prompt=prompt_doc.prompt,
             user_input=f"Analyse ce texte :\n\n{text}",
+            task="extraction"
         )
 
         return robust_json_parse(raw_response) or {}
@@ -41,7 +42,8 @@ class EnrichmentService:
 
         response = llm_service.generate_response(
             system_prompt="Tu es un expert en génération de questions.",
-            user_input=formatted_prompt
+            user_input=formatted_prompt,
+            task="hyde"
         )
         return response.strip()
 
@@ -67,7 +69,8 @@ class EnrichmentService:
 
         raw_response = llm_service.generate_response(
             system_prompt="Tu es un expert en extraction d'entités nommées (NER).",
-            user_input=formatted_prompt
+            user_input=formatted_prompt,
+            task="entities"
         )
         
         return robust_json_parse(raw_response) or {}
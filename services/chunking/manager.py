@@ -4,6 +4,7 @@ from typing import List
 from langchain_text_splitters import RecursiveCharacterTextSplitter # pip install langchain-text-splitters
 from schemas.doc import Chunk as ChunkSchema
 from services.llm import llm_service
+from utils.text_hash import content_hash
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +44,8 @@ class ChunkingManager:
                 "category": category,
                 "tags": ",".join(tags),
                 "source_type": "file_upload",
-                "length": len(content)
+                "length": len(content),
+                "content_hash": content_hash(content)
             }
 
             chunk_schemas.append(ChunkSchema(
@@ -31,6 +31,7 @@ class GeneralStrategy(ChunkingStrategy):
             content_for_chunk = rc.page_content
             
             # 2. ENRICHISSEMENT 1 : Questions Hypothétiques
+            questions = ""
             if len(rc.page_content) > 500:
               questions = enrichment_service.generate_hypothetical_questions(rc.page_content)
             if questions:
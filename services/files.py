@@ -10,6 +10,7 @@ from schemas.doc import DocCreate
 from utils.text_extractor import text_extractor
 from services.chunking.manager import chunking_manager
 from services.ingestion import ingestion_service # Pour réutiliser logic synthèse si besoin
+from services.llm_scheduler import set_current_employee
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +52,7 @@ class FilesService:
         return {"status": "success", "message": "PROCESSING_STARTED", "job_id": job_id}
 
     def _process_file_background(self, doc_name: str, content_bytes: bytes, tags: list[str], employee: str, job_id: str, content_type: str):
+        set_current_employee(employee)
         try:
             logger.info(f"🚀 [Job {job_id}] Démarrage traitement background : {doc_name}")
 
@@ -69,20 +71,14 @@ class FilesService:
             # On peut imaginer ici un appel LLM pour déterminer la catégorie
             category = "document" 
             
-            # C. Chunking & Vectorisation
-            chunks = chunking_manager.chunk_data(doc_name, text_content, category, tags)
-
-            # D. Persistance Vectorielle (Chroma)
-            chunk_repository.add_chunks(doc_name, employee, chunks)
-
-            # E. Mise à jour Document (Statut: Done)
+            # C. Mise à jour Document (contenu final, toujours en cours de traitement)
             final_doc = DocCreate(
                 doc=doc_name,
                 category=category,
                 source="manual",
                 origin="upload",
                 tags=tags,
-                status="Done",
+                status="Processing",
                 employee=employee,
                 job_id=job_id,
                 page_content={
@@ -92,6 +88,13 @@ class FilesService:
                 quality=10.0 # Arbitraire pour fichier manuel
             )
             doc_repository.upsert_doc(final_doc)
+
+            # D. Chunking & Persistance Vectorielle (Chroma) - incrémentale si activée
+            chunks = chunking_manager.chunk_data(doc_name, text_content, category, tags)
+            ingestion_service.save_chunks(doc_name, employee, chunks)
+
+            # E. Statut Done (reporté sur les métadonnées filtrables des chunks)
+            doc_repository.update_status(doc_name, employee, "Done")
             
             logger.info(f"✅ [Job {job_id}] Traitement terminé avec succès pour {doc_name}")
 
@@ -13,11 +13,23 @@ from repositories.tavily import tavily_repository
 from utils.text_extractor import text_extractor
 from services.chunking.manager import chunking_manager
 from services.chunking.enrichment import enrichment_service
+from services.llm_scheduler import set_current_employee
 
 logger = logging.getLogger(__name__)
 
 class IngestionService:
 
+    def __init__(self):
+        # Mode incrémental : diff des chunks au lieu de tout supprimer/réécrire
+        self.incremental = os.getenv("INCREMENTAL_INGESTION", "true").lower() == "true"
+
+    def save_chunks(self, doc_id: str, employee: str, chunks: list) -> None:
+        """Persistance vectorielle selon le mode (incrémental ou remplacement complet)."""
+        if self.incremental:
+            chunk_repository.sync_chunks(doc_id, employee, chunks)
+        else:
+            chunk_repository.add_chunks(doc_id, employee, chunks)
+
     def _clean_text_content(self, html_content: str) -> str:
         if not html_content:
             return ""
@@ -77,6 +89,8 @@ class IngestionService:
             return ""
 
     def process_input(self, input_data: str | dict, employee: str, tags: list[str], origin: str = "manual"):
+        # Les appels LLM d'enrichissement passent dans la voie 'ingestion' de l'ordonnanceur, au nom de cet employee
+        set_current_employee(employee)
         doc_name = "Document sans titre"
         content_data = "" 
         source_type = "manual"
@@ -130,19 +144,27 @@ class IngestionService:
     def _process_content(self, doc_id: str, content_data: any, category: str, employee: str, tags: list[str], origin: str, source: str):
         job_id = f"job_{int(datetime.now().timestamp())}"
         preview_text = str(content_data)[:3000]
+        page_content = content_data if isinstance(content_data, dict) else {"text": content_data}
+
+        # En mode incrémental, un contenu strictement identique réutilise la synthèse existante
+        existing_doc = doc_repository.get_doc(doc_id, employee) if self.incremental else None
         
         # Synthèse IA
         synthesis_data = {}
-        try:
-            synthesis_input = f"Doc: {doc_id}\nContent: {preview_text}"
-            synthesis_data = enrichment_service.extract_metadata(synthesis_input, "synthesis_tags")
-        except Exception as e:
-            logger.warning(f"⚠️ Erreur Synthèse: {e}")
+        if existing_doc and existing_doc.page_content == page_content and existing_doc.synthesis:
+            logger.info(f"♻️ Contenu inchangé pour {doc_id} : synthèse réutilisée.")
+            synthesis_data = {"synthesis": existing_doc.synthesis, "suggested_tags": existing_doc.suggested_tags}
+        else:
+            try:
+                synthesis_input = f"Doc: {doc_id}\nContent: {preview_text}"
+                synthesis_data = enrichment_service.extract_metadata(synthesis_input, "synthesis_tags")
+            except Exception as e:
+                logger.warning(f"⚠️ Erreur Synthèse: {e}")
 
         doc_data = DocCreate(
             doc=doc_id, category=category, source=source, origin=origin, tags=tags,
             status="Processing", employee=employee, job_id=job_id,
-            page_content=content_data if isinstance(content_data, dict) else {"text": content_data},
+            page_content=page_content,
             synthesis=synthesis_data.get("synthesis", ""),
             suggested_tags=synthesis_data.get("suggested_tags", [])
         )
@@ -153,7 +175,7 @@ class IngestionService:
             if not chunks_to_save:
                 logger.warning(f"⚠️ 0 chunk pour {doc_id}")
             
-            chunk_repository.add_chunks(doc_id, employee, chunks_to_save)
+            self.save_chunks(doc_id, employee, chunks_to_save)
             doc_repository.update_status(doc_id, employee, "Done")
             
             return {"status": "success", "doc_id": doc_id, "chunks_count": len(chunks_to_save), "strategy": category}
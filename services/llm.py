@@ -1,16 +1,121 @@
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from repositories.llm_response_cache import llm_response_cache_repository
+from services.llm_scheduler import llm_scheduler
+from utils.token_counter import count_tokens
+import os
+import asyncio
 import logging
+import threading
+import time
+import requests
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Profils de tâches : modèle Ollama par type d'appel, ex. "router=llama3.2:1b,rerank=llama3.2:1b,hyde=llama3.2:1b".
+# Tâches : chat, router, rerank, rewrite, extraction, hyde, entities. Non listée -> modèle par défaut.
+LLM_TASK_MODELS = {
+    task.strip(): model.strip()
+    for task, _, model in (item.partition("=") for item in os.getenv("LLM_TASK_MODELS", "").split(","))
+    if task.strip() and model.strip()
+}
+
+# Plafond num_ctx par modèle (prioritaire sur LLM_MAX_NUM_CTX), ex. "llama3.2=8192,llama3.2:1b=4096".
+# Utile quand LLM_TASK_MODELS mélange des modèles de tailles (et d'empreintes mémoire) différentes.
+LLM_MODEL_MAX_NUM_CTX = {
+    model.strip(): int(num_ctx)
+    for model, _, num_ctx in (item.rpartition("=") for item in os.getenv("LLM_MODEL_MAX_NUM_CTX", "").split(","))
+    if model.strip() and num_ctx.strip().isdigit()
+}
+
+def fetch_ollama_model_info(model_name: str) -> dict:
+    """Métadonnées du modèle servies par Ollama (/api/show), dont la taille de contexte native."""
+    response = requests.post(f"{OLLAMA_BASE_URL}/api/show", json={"model": model_name}, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+class ModelRuntime:
+    """
+    État d'un modèle : fenêtre de contexte (résolue une fois) et chaîne compilée pour son num_ctx
+    fixe (client ChatOllama + template + parser réutilisés d'un appel à l'autre). Une seconde
+    chaîne n'apparaît que si la fenêtre est résolue après un repli sur le plafond.
+    """
+
+    def __init__(self, model_name: str, max_num_ctx: int, min_num_ctx: int,
+                 model_info_fetcher: Callable[[str], dict], prompt: ChatPromptTemplate):
+        self.model_name = model_name
+        self.max_num_ctx = max_num_ctx
+        self.min_num_ctx = min_num_ctx
+        self._model_info_fetcher = model_info_fetcher
+        self._prompt = prompt
+        self._context_window: Optional[int] = None
+        # Échec de /api/show : repli sur max_num_ctx jusqu'à _retry_at
+        self.retry_seconds = float(os.getenv("LLM_MODEL_INFO_RETRY_SECONDS", "30"))
+        self._retry_at = 0.0
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse_context_length(model_info: dict) -> Optional[int]:
+        for key, value in (model_info.get("model_info") or {}).items():
+            if key.endswith(".context_length") and isinstance(value, int):
+                return value
+        return None
+
+    def get_context_window(self) -> int:
+        """
+        Fenêtre utilisable en tokens : taille native du modèle (Ollama /api/show),
+        plafonnée par LLM_MAX_NUM_CTX (mémoire disponible). Résolue une seule fois en cas de succès ;
+        si Ollama ne répond pas, le plafond sert de repli et la lecture est retentée après un délai.
+        """
+        if self._context_window is not None:
+            return self._context_window
+        if time.monotonic() < self._retry_at:
+            return self.max_num_ctx
+
+        try:
+            native = self._parse_context_length(self._model_info_fetcher(self.model_name))
+        except Exception as e:
+            self._retry_at = time.monotonic() + self.retry_seconds
+            logger.warning(f"⚠️ [LLM] Taille de contexte Ollama indisponible ({e}), plafond {self.max_num_ctx} tokens (nouvel essai dans {self.retry_seconds:.0f}s).")
+            return self.max_num_ctx
+
+        self._context_window = min(native, self.max_num_ctx) if native else self.max_num_ctx
+        logger.info(f"🧠 [LLM] Fenêtre de contexte '{self.model_name}' : {self._context_window} tokens (natif : {native}).")
+        return self._context_window
+
+    def needs_lookup(self) -> bool:
+        """Vrai si get_context_window() interrogerait Ollama (appel réseau bloquant)."""
+        return self._context_window is None and time.monotonic() >= self._retry_at
+
+    @property
+    def num_ctx(self) -> int:
+        # num_ctx fixe par modèle : Ollama recharge le modèle à chaque changement de num_ctx,
+        # une valeur unique permet à tous les appels (router, rerank, chat...) de partager le même runner.
+        return max(self.get_context_window(), self.min_num_ctx)
+
+    def chain(self, num_ctx: int):
+        chain = self._chains.get(num_ctx)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(num_ctx)
+                if chain is None:
+                    client = ChatOllama(model=self.model_name, temperature=0, num_ctx=num_ctx)
+                    chain = self._prompt | client | StrOutputParser()
+                    self._chains[num_ctx] = chain
+        return chain
+
 class LLMService:
     
     # Configuration des capacités (Tokens -> Char approx)
     # 1 token ~= 4 caractères. On garde une marge de sécurité de 20% pour le prompt système et la réponse.
     # Ex: Llama 3.2 supporte 128k tokens, mais en local sur Ollama par défaut c'est souvent 2k, 4k ou 8k selon la RAM.
     # Ici on définit des valeurs "safe" pour une machine standard (16/32GB RAM).
+    # Sert aussi de plafond mémoire par défaut pour num_ctx (LLM_MAX_NUM_CTX).
     MODEL_CAPABILITIES = {
         "llama3.2": 32000,      # ~8k tokens
         "llama3.2:1b": 16000,   # ~4k tokens (Version légère)
@@ -22,38 +127,178 @@ class LLMService:
     # Valeur par défaut si modèle inconnu
     DEFAULT_LIMIT = 8000 
 
-    def __init__(self, model_name: str = "llama3.2"):
+    PROMPT_TEMPLATE = """
+        {system_instruction}
+        
+        CONTEXTE (Si fourni) :
+        {context}
+        
+        QUESTION : {input}
+        """
+
+    MIN_NUM_CTX = 2048
+
+    def __init__(self, model_name: str = "llama3.2", model_info_fetcher: Optional[Callable[[str], dict]] = None,
+                 task_models: Optional[Dict[str, str]] = None):
         self.model_name = model_name
-        self.llm = ChatOllama(model=model_name, temperature=0)
+        self.task_models = dict(LLM_TASK_MODELS if task_models is None else task_models)
         
         # Définition dynamique de la limite au démarrage
         self.context_char_limit = self.MODEL_CAPABILITIES.get(model_name, self.DEFAULT_LIMIT)
+        self.reserved_output_tokens = int(os.getenv("LLM_RESERVED_OUTPUT_TOKENS", "1024"))
+
+        # Injectable (tests) : par défaut, interrogation d'Ollama au premier besoin
+        self._model_info_fetcher = model_info_fetcher or fetch_ollama_model_info
+        self._prompt = ChatPromptTemplate.from_template(self.PROMPT_TEMPLATE)
+        self._runtimes: Dict[str, ModelRuntime] = {}
+        self._runtimes_lock = threading.Lock()
+        self._template_tokens = count_tokens(
+            self.PROMPT_TEMPLATE.replace("{system_instruction}", "").replace("{context}", "").replace("{input}", "")
+        )
         logger.info(f"🧠 [LLM] Modèle '{model_name}' chargé. Limite contexte : {self.context_char_limit} chars.")
+        if self.task_models:
+            logger.info(f"🧠 [LLM] Modèles par tâche : {self.task_models}")
 
     def get_context_limit(self) -> int:
         """Retourne la limite de caractères sécurisée pour le contexte."""
         return self.context_char_limit
 
-    def generate_response(self, system_prompt: str, user_input: str, context: str = "") -> str:
+    def model_for(self, task: str) -> str:
+        return self.task_models.get(task, self.model_name)
+
+    def _max_num_ctx(self, model_name: str) -> int:
+        """Plafond num_ctx : LLM_MODEL_MAX_NUM_CTX du modèle, sinon LLM_MAX_NUM_CTX, sinon sa capacité connue."""
+        if model_name in LLM_MODEL_MAX_NUM_CTX:
+            return LLM_MODEL_MAX_NUM_CTX[model_name]
+        default_cap = self.MODEL_CAPABILITIES.get(model_name, self.DEFAULT_LIMIT) // 4
+        return int(os.getenv("LLM_MAX_NUM_CTX", str(default_cap)))
+
+    def _runtime(self, task: str) -> ModelRuntime:
+        model_name = self.model_for(task)
+        runtime = self._runtimes.get(model_name)
+        if runtime is None:
+            with self._runtimes_lock:
+                runtime = self._runtimes.get(model_name)
+                if runtime is None:
+                    runtime = ModelRuntime(
+                        model_name,
+                        max_num_ctx=self._max_num_ctx(model_name),
+                        min_num_ctx=self.MIN_NUM_CTX,
+                        model_info_fetcher=self._model_info_fetcher,
+                        prompt=self._prompt
+                    )
+                    self._runtimes[model_name] = runtime
+        return runtime
+
+    def get_context_window(self, task: str = "chat") -> int:
+        return self._runtime(task).get_context_window()
+
+    def warm_up(self):
+        """Résout la fenêtre de contexte de chaque modèle configuré (appelé au démarrage)."""
+        for task in {"chat", *self.task_models}:
+            self.get_context_window(task)
+
+    def count_prompt_tokens(self, system_prompt: str, user_input: str, context: str = "") -> int:
+        return self._template_tokens + count_tokens(system_prompt) + count_tokens(user_input) + count_tokens(context)
+
+    def get_context_token_budget(self, system_prompt: str = "", user_input: str = "", task: str = "chat") -> int:
+        """Tokens disponibles pour le contexte, une fois le prompt, l'entrée et la réponse réservés."""
+        used = self.count_prompt_tokens(system_prompt, user_input) + self.reserved_output_tokens
+        return max(0, self.get_context_window(task) - used)
+
+    async def aresolve_context_window(self, task: str = "chat"):
         """
-        Génère une réponse simple basée sur un prompt système et une entrée utilisateur.
+        Pour les chemins async : si la fenêtre du modèle n'est pas encore connue (warm_up en échec),
+        la lecture Ollama /api/show se fait dans un thread et non sur la boucle d'événements.
+        Ensuite get_context_window() ne fait plus d'appel réseau (valeur résolue ou délai de nouvel essai).
         """
-        prompt = ChatPromptTemplate.from_template("""
-        {system_instruction}
-        
-        CONTEXTE (Si fourni) :
-        {context}
-        
-        QUESTION : {input}
-        """)
+        runtime = self._runtime(task)
+        if runtime.needs_lookup():
+            await asyncio.to_thread(runtime.get_context_window)
 
-        chain = prompt | self.llm | StrOutputParser()
-        
-        return chain.invoke({
+    def _chain(self, task: str, system_prompt: str, user_input: str, context: str):
+        """Chaîne du modèle de la tâche, avec le num_ctx fixe de ce modèle."""
+        runtime = self._runtime(task)
+        prompt_tokens = self.count_prompt_tokens(system_prompt, user_input, context)
+        num_ctx = runtime.num_ctx
+        if prompt_tokens + self.reserved_output_tokens > num_ctx:
+            logger.warning(f"⚠️ [LLM] Prompt de {prompt_tokens} tokens : dépasse num_ctx={num_ctx} ({runtime.model_name}), Ollama tronquera.")
+        return runtime.chain(num_ctx)
+
+    @staticmethod
+    def _inputs(system_prompt: str, user_input: str, context: str) -> dict:
+        return {
             "system_instruction": system_prompt,
             "context": context,
             "input": user_input
-        })
+        }
+
+    def _cached(self, task: str, system_prompt: str, user_input: str, context: str):
+        if not llm_response_cache_repository.is_enabled(task):
+            return None
+        return llm_response_cache_repository.get(task, self.model_for(task), system_prompt, context, user_input)
+
+    def _store(self, task: str, system_prompt: str, user_input: str, context: str, response: str):
+        if response and llm_response_cache_repository.is_enabled(task):
+            llm_response_cache_repository.set(self.model_for(task), system_prompt, context, user_input, response)
+
+    def generate_response(self, system_prompt: str, user_input: str, context: str = "", task: str = "default") -> str:
+        """
+        Génère une réponse simple basée sur un prompt système et une entrée utilisateur.
+        task : type d'appel (extraction, hyde, entities, router, rewrite, rerank, chat...),
+        détermine le modèle utilisé (LLM_TASK_MODELS), le passage par le cache (LLM_CACHE_TASKS)
+        et la voie de priorité dans l'ordonnanceur (services/llm_scheduler.py).
+        """
+        return self.generate_response_with_source(system_prompt, user_input, context, task)[0]
+
+    def generate_response_with_source(self, system_prompt: str, user_input: str, context: str = "",
+                                      task: str = "default") -> Tuple[str, bool]:
+        """Comme generate_response, retourne (réponse, servie_par_le_cache)."""
+        cached = self._cached(task, system_prompt, user_input, context)
+        if cached is not None:
+            return cached, True
+
+        chain = self._chain(task, system_prompt, user_input, context)
+        with llm_scheduler.slot(task):
+            response = chain.invoke(self._inputs(system_prompt, user_input, context))
+        self._store(task, system_prompt, user_input, context, response)
+        return response, False
+
+    async def agenerate_response(self, system_prompt: str, user_input: str, context: str = "", task: str = "default") -> str:
+        """
+        Version asynchrone (ainvoke) : l'attente d'Ollama ne bloque pas la boucle d'événements.
+        Les lectures/écritures du cache disque passent aussi par un thread.
+        """
+        return (await self.agenerate_response_with_source(system_prompt, user_input, context, task))[0]
+
+    async def agenerate_response_with_source(self, system_prompt: str, user_input: str, context: str = "",
+                                             task: str = "default") -> Tuple[str, bool]:
+        """Comme agenerate_response, retourne (réponse, servie_par_le_cache)."""
+        cache_enabled = llm_response_cache_repository.is_enabled(task)
+        if cache_enabled:
+            cached = await asyncio.to_thread(self._cached, task, system_prompt, user_input, context)
+            if cached is not None:
+                return cached, True
+
+        await self.aresolve_context_window(task)
+        chain = self._chain(task, system_prompt, user_input, context)
+        async with llm_scheduler.aslot(task):
+            response = await chain.ainvoke(self._inputs(system_prompt, user_input, context))
+        if cache_enabled:
+            await asyncio.to_thread(self._store, task, system_prompt, user_input, context, response)
+        return response, False
+
+    async def astream_response(self, system_prompt: str, user_input: str, context: str = "", task: str = "chat") -> AsyncIterator[str]:
+        """
+        Streaming token par token (astream) : le premier fragment arrive dès qu'Ollama le produit.
+        """
+        await self.aresolve_context_window(task)
+        chain = self._chain(task, system_prompt, user_input, context)
+        # La place est tenue pendant tout le flux (Ollama génère jusqu'au dernier token)
+        async with llm_scheduler.aslot(task):
+            async for fragment in chain.astream(self._inputs(system_prompt, user_input, context)):
+                if fragment:
+                    yield fragment
 
 # Instance par défaut
-llm_service = LLMService()
\ No newline at end of file
+llm_service = LLMService()
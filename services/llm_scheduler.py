@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Voies de priorité (0 = la plus prioritaire)
+INTERACTIVE = 0   # réponse finale du chat
+AUXILIARY = 1     # router, rerank, rewrite (sur le chemin d'un chat, mais non visibles)
+INGESTION = 2     # enrichissement en masse (synthèse, HyDE, entités)
+LANE_NAMES = {INTERACTIVE: "interactive", AUXILIARY: "auxiliary", INGESTION: "ingestion"}
+
+TASK_LANES = {
+    "chat": INTERACTIVE,
+    "router": AUXILIARY,
+    "rerank": AUXILIARY,
+    "rewrite": AUXILIARY,
+    "extraction": INGESTION,
+    "hyde": INGESTION,
+    "entities": INGESTION,
+}
+
+# Employee à l'origine de l'appel LLM courant (équité entre utilisateurs dans une même voie)
+current_employee: contextvars.ContextVar[str] = contextvars.ContextVar("llm_current_employee", default="")
+
+def set_current_employee(employee: str):
+    """À appeler en entrée de chat / d'ingestion. Les threads et tâches lancés ensuite héritent de la valeur."""
+    current_employee.set(employee or "")
+
+class _Ticket:
+    """
+    Demande de place en attente. Un appelant synchrone attend sur un threading.Event,
+    un appelant asynchrone sur une asyncio.Future de sa boucle (aucun thread bloqué).
+    """
+    __slots__ = ("lane", "event", "loop", "future", "granted", "enqueued_at")
+
+    def __init__(self, lane: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.lane = lane
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+        self.enqueued_at = time.perf_counter()
+
+    def wake(self):
+        # Appelé sous le verrou de l'ordonnanceur, éventuellement depuis un autre thread que la boucle
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class LLMScheduler:
+    """
+    Ordonnanceur devant Ollama : nombre global d'appels simultanés borné, attribution des places
+    libérées par priorité de voie puis en tourniquet entre employees d'une même voie.
+    Des places sont réservées aux voies interactives : l'ingestion ne peut jamais occuper tout Ollama,
+    un chat trouve donc toujours une place sans attendre la fin d'un lot d'enrichissement.
+    """
+
+    def __init__(self):
+        self.max_concurrency = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "4"))))
+        reserved = int(os.getenv("LLM_INTERACTIVE_RESERVED", "1"))
+        self.lane_limits = {
+            INTERACTIVE: self.max_concurrency,
+            AUXILIARY: self.max_concurrency,
+            INGESTION: max(1, self.max_concurrency - reserved),
+        }
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_lane: Dict[int, int] = {lane: 0 for lane in LANE_NAMES}
+        # voie -> (employee -> file d'attente), OrderedDict = ordre du tourniquet
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Ticket]]"] = {lane: OrderedDict() for lane in LANE_NAMES}
+        self._granted: Dict[int, int] = {lane: 0 for lane in LANE_NAMES}
+        self._wait_seconds: Dict[int, float] = {lane: 0.0 for lane in LANE_NAMES}
+
+    @staticmethod
+    def lane_for(task: str) -> int:
+        return TASK_LANES.get(task, AUXILIARY)
+
+    def _can_run(self, lane: int) -> bool:
+        return self._active < self.max_concurrency and self._active_by_lane[lane] < self.lane_limits[lane]
+
+    def _start(self, ticket: _Ticket):
+        self._active += 1
+        self._active_by_lane[ticket.lane] += 1
+        ticket.granted = True
+
+    def _record_wait(self, ticket: _Ticket):
+        # Mesuré côté appelant, au réveil effectif (inclut la reprise du thread ou de la boucle)
+        waited = time.perf_counter() - ticket.enqueued_at
+        with self._lock:
+            self._granted[ticket.lane] += 1
+            self._wait_seconds[ticket.lane] += waited
+
+    def _pop_next(self) -> Optional[_Ticket]:
+        """Prochain ticket admissible : voie la plus prioritaire, puis employee suivant du tourniquet."""
+        for lane in sorted(self._queues):
+            queues = self._queues[lane]
+            if not queues or not self._can_run(lane):
+                continue
+            employee, tickets = next(iter(queues.items()))
+            ticket = tickets.popleft()
+            del queues[employee]
+            if tickets:
+                queues[employee] = tickets  # repasse en fin de tourniquet
+            return ticket
+        return None
+
+    def _dispatch(self):
+        while True:
+            ticket = self._pop_next()
+            if ticket is None:
+                return
+            self._start(ticket)
+            ticket.wake()
+
+    def _enqueue(self, ticket: _Ticket, employee: str):
+        with self._lock:
+            self._queues[ticket.lane].setdefault(employee, deque()).append(ticket)
+            self._dispatch()
+
+    def _withdraw(self, ticket: _Ticket, employee: str):
+        """Abandon d'une attente (annulation) : retire le ticket, ou rend la place s'il l'a déjà obtenue."""
+        with self._lock:
+            if not ticket.granted:
+                tickets = self._queues[ticket.lane].get(employee)
+                if tickets is not None:
+                    try:
+                        tickets.remove(ticket)
+                    except ValueError:
+                        pass
+                    if not tickets:
+                        del self._queues[ticket.lane][employee]
+                return
+        self.release(ticket.lane)
+
+    def acquire(self, task: str) -> int:
+        """Bloque jusqu'à obtention d'une place. Retourne la voie (à passer à release)."""
+        ticket = _Ticket(self.lane_for(task))
+        self._enqueue(ticket, current_employee.get())
+        ticket.event.wait()
+        self._record_wait(ticket)
+        return ticket.lane
+
+    async def aacquire(self, task: str) -> int:
+        """Version asynchrone : attend une Future réveillée par _dispatch, sans occuper de thread."""
+        ticket = _Ticket(self.lane_for(task), asyncio.get_running_loop())
+        employee = current_employee.get()
+        self._enqueue(ticket, employee)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._withdraw(ticket, employee)
+            raise
+        self._record_wait(ticket)
+        return ticket.lane
+
+    def release(self, lane: int):
+        with self._lock:
+            self._active -= 1
+            self._active_by_lane[lane] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, task: str):
+        lane = self.acquire(task)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    @asynccontextmanager
+    async def aslot(self, task: str):
+        lane = await self.aacquire(task)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lanes = {}
+            for lane, name in LANE_NAMES.items():
+                granted = self._granted[lane]
+                lanes[name] = {
+                    "queued": sum(len(q) for q in self._queues[lane].values()),
+                    "waiting_employees": len(self._queues[lane]),
+                    "active": self._active_by_lane[lane],
+                    "limit": self.lane_limits[lane],
+                    "granted": granted,
+                    "avg_wait_ms": round(self._wait_seconds[lane] / granted * 1000, 1) if granted else 0.0
+                }
+            return {"active": self._active, "max_concurrency": self.max_concurrency, "lanes": lanes}
+
+llm_scheduler = LLMScheduler()
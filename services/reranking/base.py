@@ -0,0 +1,24 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+class Reranker(ABC):
+    """
+    Interface commune des rerankers.
+    score() renvoie un score par chunk (None = chunk non évalué), ou None si le backend est indisponible.
+    """
+    name: str = "base"
+    # Score minimal pour qu'un chunk soit conservé (dépend de l'échelle du backend)
+    threshold: float = 0.4
+
+    def version(self) -> str:
+        """Identifiant du backend + de sa config (modèle, prompt) : sert de clé au cache de scores."""
+        return self.name
+
+    @abstractmethod
+    def score(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        pass
+
+    async def ascore(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        """Version asynchrone. Par défaut, score() tourne dans un thread (backends locaux CPU)."""
+        return await asyncio.to_thread(self.score, question, chunks)
@@ -0,0 +1,65 @@
+import os
+import logging
+from typing import List, Optional
+
+from .base import Reranker
+
+logger = logging.getLogger(__name__)
+
+class CrossEncoderReranker(Reranker):
+    """
+    Cross-encoder local sur CPU (sentence-transformers, backend ONNX si disponible).
+    Un seul forward batché pour tous les candidats : quelques dizaines de ms pour 20 chunks.
+    Dépendance optionnelle (import paresseux, non installée par requirements.txt) :
+    pip install sentence-transformers, puis RERANKER_GLOBAL / RERANKER_SPECIFIC=cross_encoder
+    """
+    name = "cross_encoder"
+    threshold = 0.4
+    PREVIEW_CHARS = 800
+
+    def __init__(self):
+        # Modèle multilingue par défaut (corpus et questions en français)
+        self.model_name = os.getenv("RERANK_CROSS_ENCODER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+        self.backend = os.getenv("RERANK_CROSS_ENCODER_BACKEND", "onnx")
+        self._model = None
+
+    def version(self) -> str:
+        return f"{self.name}:{self.model_name}"
+
+    def _build(self, cross_encoder_cls, backend: str):
+        try:
+            return cross_encoder_cls(self.model_name, device="cpu", backend=backend)
+        except TypeError:
+            # Versions de sentence-transformers sans paramètre 'backend'
+            return cross_encoder_cls(self.model_name, device="cpu")
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            try:
+                self._model = self._build(CrossEncoder, self.backend)
+            except Exception as e:
+                if self.backend == "torch":
+                    raise
+                # Export ONNX absent ou optimum/onnxruntime manquant : repli sur torch
+                logger.warning(f"⚠️ [Rerank:cross_encoder] Backend '{self.backend}' indisponible ({e}), repli sur torch.")
+                self.backend = "torch"
+                self._model = self._build(CrossEncoder, self.backend)
+            logger.info(f"🧠 [Rerank:cross_encoder] Modèle '{self.model_name}' chargé ({self.backend}).")
+        return self._model
+
+    def score(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        try:
+            model = self._load()
+        except Exception as e:
+            logger.warning(f"⚠️ Cross-encoder indisponible ({e}).")
+            return None
+
+        pairs = [(question, c['content'][:self.PREVIEW_CHARS]) for c in chunks]
+        try:
+            scores = model.predict(pairs)
+        except Exception as e:
+            logger.warning(f"⚠️ Erreur inférence cross-encoder ({e}).")
+            return None
+        # predict applique déjà une sigmoïde aux modèles à une seule sortie : scores 0..1, même échelle que le juge LLM
+        return [float(score) for score in scores]
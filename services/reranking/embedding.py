@@ -0,0 +1,41 @@
+import math
+import logging
+from typing import List, Optional
+
+from database.connection import EMBEDDING_MODEL_ID, get_embedding_function
+from repositories.embedding_cache import embedding_cache_repository
+from .base import Reranker
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingReranker(Reranker):
+    """
+    Reranker économique : cosinus entre l'embedding de la question et celui des chunks.
+    Les embeddings des chunks sont en général déjà dans le cache (calculés à l'ingestion).
+    """
+    name = "embedding"
+    threshold = 0.3
+
+    def version(self) -> str:
+        return f"{self.name}:{EMBEDDING_MODEL_ID}"
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def score(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        embedding_function = get_embedding_function()
+        contents = [c['content'] for c in chunks]
+
+        vectors = embedding_cache_repository.get_many(contents)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        # Question + chunks absents du cache : un seul batch d'embedding
+        fresh = embedding_function([question] + [contents[i] for i in missing])
+        question_vector = [float(x) for x in fresh[0]]
+        for i, v in zip(missing, fresh[1:]):
+            vectors[i] = [float(x) for x in v]
+
+        return [self._cosine(question_vector, v) for v in vectors]
@@ -0,0 +1,165 @@
+import os
+import math
+import asyncio
+import contextvars
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from repositories.prompt import prompt_repository
+from services.llm import llm_service
+from utils.json_parser import robust_json_parse
+from utils.text_hash import content_hash
+from .base import Reranker
+
+logger = logging.getLogger(__name__)
+
+class LLMReranker(Reranker):
+    """
+    Juge LLM : prompt 'agent_rerank', lots de 5 chunks (aperçu 800 chars), réponse JSON.
+    Le plus précis, mais le plus lent (un appel LLM par lot).
+
+    Les lots sont indépendants : ils partent en parallèle (pool partagé borné, à aligner sur
+    OLLAMA_NUM_PARALLEL) et les lots qui dépassent le délai sont abandonnés.
+    """
+    name = "llm"
+    threshold = 0.4
+    BATCH_SIZE = 5
+    PREVIEW_CHARS = 800
+    SYSTEM_PROMPT = "Tu es un système de scoring JSON. Réponds UNIQUEMENT avec un tableau JSON strict."
+
+    def __init__(self):
+        self.max_in_flight = int(os.getenv("RERANK_MAX_IN_FLIGHT", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+        self.deadline_seconds = float(os.getenv("RERANK_DEADLINE_SECONDS", "30"))
+        # Pool partagé entre toutes les requêtes : borne le nombre d'appels simultanés vers Ollama
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_in_flight), thread_name_prefix="rerank")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def version(self) -> str:
+        prompt_doc = prompt_repository.get_by_name("agent_rerank")
+        prompt_hash = content_hash(prompt_doc.prompt)[:12] if prompt_doc else "none"
+        return f"{self.name}:{llm_service.model_for('rerank')}:{prompt_hash}"
+
+    def _batch_prompt(self, prompt_template: str, question: str, batch: List[dict]) -> str:
+        context_text = ""
+        for idx, c in enumerate(batch):
+            preview = c['content'][:self.PREVIEW_CHARS].replace("\n", " ")
+            context_text += f"--- Chunk {idx} ---\n{preview}\n\n"
+
+        return prompt_template.replace("{question}", question).replace("{context}", context_text)
+
+    @staticmethod
+    def _parse_scores(llm_response: str, batch: List[dict]) -> Dict[int, float]:
+        scores_data = robust_json_parse(llm_response)
+        if isinstance(scores_data, dict): scores_data = [scores_data]
+
+        batch_scores = {}
+        if isinstance(scores_data, list):
+            for item in scores_data:
+                if not isinstance(item, dict):
+                    continue
+                local_idx = item.get("chunk_index")
+                if local_idx is not None and isinstance(local_idx, int) and 0 <= local_idx < len(batch):
+                    batch_scores[local_idx] = item.get("score", 0.0)
+        return batch_scores
+
+    def _score_batch(self, prompt_template: str, question: str, batch: List[dict]) -> Dict[int, float]:
+        """Score un lot. Retourne {index local -> score}."""
+        llm_response = llm_service.generate_response(
+            system_prompt=self.SYSTEM_PROMPT,
+            user_input=self._batch_prompt(prompt_template, question, batch),
+            task="rerank"
+        )
+        return self._parse_scores(llm_response, batch)
+
+    async def _ascore_batch(self, prompt_template: str, question: str, batch: List[dict]) -> Dict[int, float]:
+        async with self._async_slots():
+            llm_response = await llm_service.agenerate_response(
+                system_prompt=self.SYSTEM_PROMPT,
+                user_input=self._batch_prompt(prompt_template, question, batch),
+                task="rerank"
+            )
+        return self._parse_scores(llm_response, batch)
+
+    def _async_slots(self) -> asyncio.Semaphore:
+        """Sémaphore partagé par toutes les requêtes async (même borne que le pool de threads)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.max_in_flight))
+        return self._semaphore
+
+    def score(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        prompt_doc = prompt_repository.get_by_name("agent_rerank")
+        if not prompt_doc:
+            return None
+
+        scores: List[Optional[float]] = [None] * len(chunks)
+        num_batches = math.ceil(len(chunks) / self.BATCH_SIZE)
+        starts = [i * self.BATCH_SIZE for i in range(num_batches)]
+
+        logger.info(f"⚖️ [Rerank:llm] {len(chunks)} chunks ({num_batches} batches, {self.max_in_flight} en parallèle max)...")
+        t0 = time.perf_counter()
+
+        futures = [
+            # Contexte copié : l'employee courant suit le lot jusqu'à l'ordonnanceur LLM
+            self._executor.submit(
+                contextvars.copy_context().run, self._score_batch, prompt_doc.prompt, question, chunks[start:start + self.BATCH_SIZE]
+            )
+            for start in starts
+        ]
+        done, not_done = wait(futures, timeout=self.deadline_seconds)
+
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.warning(f"⏱️ [Rerank:llm] {len(not_done)} batch(es) abandonné(s) après {self.deadline_seconds}s.")
+
+        # Fusion déterministe : dans l'ordre des lots, quel que soit l'ordre de complétion
+        for start, future in zip(starts, futures):
+            if future not in done:
+                continue
+            try:
+                batch_scores = future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ [Rerank:llm] Batch {start // self.BATCH_SIZE} en échec : {e}")
+                continue
+            for local_idx, value in batch_scores.items():
+                scores[start + local_idx] = value
+
+        logger.info(f"⚖️ [Rerank:llm] Terminé en {time.perf_counter() - t0:.2f}s.")
+        return scores
+
+    async def ascore(self, question: str, chunks: List[dict]) -> Optional[List[Optional[float]]]:
+        """Version asynchrone : lots lancés en concurrence (sémaphore), délai global identique."""
+        prompt_doc = await asyncio.to_thread(prompt_repository.get_by_name, "agent_rerank")
+        if not prompt_doc:
+            return None
+
+        scores: List[Optional[float]] = [None] * len(chunks)
+        starts = list(range(0, len(chunks), self.BATCH_SIZE))
+
+        logger.info(f"⚖️ [Rerank:llm] {len(chunks)} chunks ({len(starts)} batches async, {self.max_in_flight} en parallèle max)...")
+        t0 = time.perf_counter()
+
+        tasks = [
+            asyncio.create_task(self._ascore_batch(prompt_doc.prompt, question, chunks[start:start + self.BATCH_SIZE]))
+            for start in starts
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline_seconds)
+
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"⏱️ [Rerank:llm] {len(pending)} batch(es) abandonné(s) après {self.deadline_seconds}s.")
+
+        for start, task in zip(starts, tasks):
+            if task not in done:
+                continue
+            if task.exception() is not None:
+                logger.warning(f"⚠️ [Rerank:llm] Batch {start // self.BATCH_SIZE} en échec : {task.exception()}")
+                continue
+            for local_idx, value in task.result().items():
+                scores[start + local_idx] = value
+
+        logger.info(f"⚖️ [Rerank:llm] Terminé en {time.perf_counter() - t0:.2f}s.")
+        return scores
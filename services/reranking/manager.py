@@ -0,0 +1,42 @@
+import os
+import logging
+from typing import Dict
+
+from .base import Reranker
+from .llm import LLMReranker
+from .cross_encoder import CrossEncoderReranker
+from .embedding import EmbeddingReranker
+
+logger = logging.getLogger(__name__)
+
+class RerankerManager:
+    """
+    Sélectionne le backend de reranking par workflow (GLOBAL / SPECIFIC).
+    Config : RERANKER_GLOBAL, RERANKER_SPECIFIC = llm | cross_encoder | embedding
+    """
+
+    BACKENDS = {
+        "llm": LLMReranker,
+        "cross_encoder": CrossEncoderReranker,
+        "embedding": EmbeddingReranker,
+    }
+
+    def __init__(self):
+        self.config = {
+            "GLOBAL": os.getenv("RERANKER_GLOBAL", "llm").lower(),
+            "SPECIFIC": os.getenv("RERANKER_SPECIFIC", "llm").lower(),
+        }
+        self._instances: Dict[str, Reranker] = {}
+
+    def get(self, name: str) -> Reranker:
+        if name not in self.BACKENDS:
+            logger.warning(f"⚠️ Reranker inconnu '{name}', fallback sur 'llm'.")
+            name = "llm"
+        if name not in self._instances:
+            self._instances[name] = self.BACKENDS[name]()
+        return self._instances[name]
+
+    def for_strategy(self, strategy_name: str) -> Reranker:
+        return self.get(self.config.get(strategy_name, "llm"))
+
+reranker_manager = RerankerManager()
@@ -0,0 +1,88 @@
+import os
+import math
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from database.connection import get_embedding_function
+from repositories.router_decision import router_decision_repository
+
+logger = logging.getLogger(__name__)
+
+class StrategyRouter:
+    """
+    Routeur local GLOBAL / SPECIFIC par plus proche centroïde sur les embeddings de requêtes
+    (même modèle d'embedding que Chroma). Amorcé avec les décisions loggées du routeur LLM :
+    tant qu'une classe a trop peu d'exemples, ou si la marge entre centroïdes est faible,
+    classify() renvoie None et l'appelant consulte le LLM.
+    """
+
+    LABELS = ("GLOBAL", "SPECIFIC")
+
+    def __init__(self):
+        self.min_samples = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+        self.min_margin = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))
+        self._sums: Dict[str, List[float]] = {}
+        self._counts: Dict[str, int] = {label: 0 for label in self.LABELS}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else vector
+
+    def _add_sample(self, label: str, vector: List[float]):
+        vector = self._normalize(vector)
+        current = self._sums.get(label)
+        self._sums[label] = vector[:] if current is None else [a + b for a, b in zip(current, vector)]
+        self._counts[label] = self._counts.get(label, 0) + 1
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            samples = router_decision_repository.get_training_set()
+            for label, vector in samples:
+                if label in self.LABELS and vector:
+                    self._add_sample(label, vector)
+            self._loaded = True
+            logger.info(f"🧭 [Router] Centroïdes chargés : {self._counts}")
+
+    def embed(self, query: str) -> List[float]:
+        return [float(x) for x in get_embedding_function()([query])[0]]
+
+    def classify(self, query_vector: List[float]) -> Tuple[Optional[str], float]:
+        """
+        Retourne (label, marge). label = None si le classifieur n'est pas assez sûr de lui.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if any(self._counts.get(label, 0) < self.min_samples for label in self.LABELS):
+                return None, 0.0
+            centroids = {label: self._normalize(self._sums[label]) for label in self.LABELS}
+
+        vector = self._normalize(query_vector)
+        similarities = sorted(
+            ((sum(a * b for a, b in zip(vector, c)), label) for label, c in centroids.items()),
+            reverse=True
+        )
+        margin = similarities[0][0] - similarities[1][0]
+        if margin < self.min_margin:
+            return None, margin
+        return similarities[0][1], margin
+
+    def record(self, query: str, query_vector: List[float], label: str):
+        """
+        Enregistre une décision du LLM (persistée + centroïdes mis à jour à chaud).
+        Une question déjà apprise (même texte normalisé) n'est pas recomptée.
+        """
+        if label not in self.LABELS:
+            return
+        self._ensure_loaded()
+        if not router_decision_repository.add_decision(query, label, query_vector):
+            return
+        with self._lock:
+            self._add_sample(label, query_vector)
+
+strategy_router = StrategyRouter()
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class DiskLRUCache:
+    """
+    Cache clé/valeur persistant (fichier SQLite) avec éviction LRU bornée en nombre d'entrées.
+    La connexion est ouverte au premier usage pour ne rien créer sur disque à l'import.
+
+    Une lecture n'écrit pas : les accès (last_access) sont mémorisés puis appliqués par lot,
+    avec l'écriture suivante ou quand le tampon est plein / ancien. Le nombre d'entrées est
+    tenu à jour en mémoire ; il n'est recompté sur disque qu'avant une éviction (fichier
+    éventuellement partagé entre plusieurs process).
+    """
+
+    # Nombre max de variables par requête SQL (limite SQLite prudente)
+    _SQL_BATCH = 500
+    # Tampon des accès LRU : vidé au-delà de N clés ou de N secondes
+    TOUCH_BATCH = 256
+    TOUCH_FLUSH_SECONDS = 30.0
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self._pending_touches: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+            conn.commit()
+            self._count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Retourne uniquement les clés trouvées. Les hits sont 'rafraîchis' pour le LRU."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(keys), self._SQL_BATCH):
+                batch = keys[start:start + self._SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update({k: v for k, v in rows})
+
+            if found:
+                now = time.time()
+                for k in found:
+                    self._pending_touches[k] = now
+                if (len(self._pending_touches) >= self.TOUCH_BATCH
+                        or time.monotonic() - self._last_flush >= self.TOUCH_FLUSH_SECONDS):
+                    self._flush_touches(conn)
+                    conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            keys = list(items)
+            existing = set()
+            for start in range(0, len(keys), self._SQL_BATCH):
+                batch = keys[start:start + self._SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(k for (k,) in conn.execute(
+                    f"SELECT key FROM cache WHERE key IN ({placeholders})", batch
+                ))
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?)",
+                [(k, v, now) for k, v in items.items()]
+            )
+            self._count += len(keys) - len(existing)
+            for k in keys:
+                self._pending_touches.pop(k, None)
+            self._flush_touches(conn)
+            self._evict(conn)
+            conn.commit()
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys]).rowcount
+            self._count = max(0, self._count - max(deleted, 0))
+            for k in keys:
+                self._pending_touches.pop(k, None)
+            conn.commit()
+
+    def _flush_touches(self, conn: sqlite3.Connection):
+        """Applique les accès mémorisés (appelé sous verrou, commit à la charge de l'appelant)."""
+        if self._pending_touches:
+            conn.executemany(
+                "UPDATE cache SET last_access = ? WHERE key = ?",
+                [(ts, k) for k, ts in self._pending_touches.items()]
+            )
+            self._pending_touches.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self._count <= self.max_entries:
+            return
+        # Compteur mémoire dépassé : recompte réel (un autre process a pu supprimer des entrées)
+        self._count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # On redescend à 90% de la capacité pour ne pas évincer à chaque écriture
+        to_remove = self._count - int(self.max_entries * 0.9)
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+            (to_remove,)
+        )
+        self._count -= to_remove
+        logger.info(f"🧹 [Cache] {to_remove} entrées évincées de {os.path.basename(self.path)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._connect()
+            entries = self._count
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
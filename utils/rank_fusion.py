@@ -0,0 +1,12 @@
+from typing import Dict, List, Sequence, Tuple
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fusion RRF : score(id) = somme des 1 / (k + rang) sur chaque classement.
+    Retourne les ids dédupliqués, triés par score décroissant (ordre stable à égalité).
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,16 @@
+import hashlib
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Normalisation légère avant hashage : Unicode NFC + espaces compactés.
+    Deux textes qui ne diffèrent que par la mise en forme produisent le même hash.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+def content_hash(text: str) -> str:
+    """Hash SHA-256 (hex) du texte normalisé."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
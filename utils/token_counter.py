@@ -0,0 +1,36 @@
+import math
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """
+    Tokenizer BPE tiktoken (dans requirements.txt). L'encodage cl100k est téléchargé au premier usage :
+    sans tiktoken ou hors ligne, c'est l'estimation heuristique qui s'applique.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.info(f"ℹ️ [Tokens] tiktoken indisponible ({e}), estimation heuristique.")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """
+    Nombre de tokens d'un texte. tiktoken (cl100k, proche des tokenizers Llama 3) si installé,
+    sinon estimation conservatrice : max(mots/ponctuation * 1.3, caractères / 3.5).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(max(len(_WORDS.findall(text)) * 1.3, len(text) / 3.5))